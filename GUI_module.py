@@ -84,6 +84,7 @@ class ConferenceGUI(QtWidgets.QMainWindow):
         # 视频显示区域
         self.video_label = QtWidgets.QLabel()
         self.video_label.setFixedSize(640, 480)
+        self.client.viewport = (self.video_label.width(), self.video_label.height())
         self.video_label.setStyleSheet("background-color: black;")
         main_layout.addWidget(self.video_label)
 
@@ -0,0 +1,311 @@
+# 音频处理: 服务器端混音, 流式降噪, 抖动缓冲与播放
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from config import CHUNK, RATE, AUDIO_MIX_MAX_DEPTH, DENOISE_FFT_SIZE, JITTER_MIN_BLOCKS, JITTER_MAX_BLOCKS
+
+
+class AudioMixer:
+    def __init__(self, block_size=CHUNK, max_depth=AUDIO_MIX_MAX_DEPTH):
+        """
+        Mix the PCM blocks (int16) of all speakers so that every listener gets a single
+        stream without its own voice (N-1 mixing).
+
+        :param block_size: samples per block, CHUNK by default
+        :param max_depth: blocks queued per speaker before the oldest is dropped
+        """
+        self.block_size = block_size
+        self.max_depth = max_depth
+        self.sources = {}  # client_id: deque of (seq, timestamp, np.ndarray), ordered by seq
+        self.last_seq = {}  # client_id: seq of the last block mixed
+        self.dropped = 0
+
+    def push(self, client_id, seq, timestamp, pcm):
+        """
+        Queue one received block of a speaker.
+
+        :param pcm: bytes, int16 mono PCM
+        """
+        block = np.frombuffer(pcm, dtype=np.int16)
+        if len(block) != self.block_size:
+            block = np.resize(block, self.block_size) if len(block) else np.zeros(self.block_size, np.int16)
+        if client_id in self.last_seq and seq <= self.last_seq[client_id]:
+            self.dropped += 1  # 迟到或重复的块
+            return
+        queue = self.sources.setdefault(client_id, deque())
+        index = len(queue)
+        while index > 0 and queue[index - 1][0] > seq:  # 按序号插入, 通常直接追加在末尾
+            index -= 1
+        if index > 0 and queue[index - 1][0] == seq:
+            self.dropped += 1
+            return
+        queue.insert(index, (seq, timestamp, block))
+        while len(queue) > self.max_depth:  # 该发言者落后太多, 丢掉最旧的块以对齐其他人
+            queue.popleft()
+            self.dropped += 1
+
+    def remove_source(self, client_id):
+        self.sources.pop(client_id, None)
+        self.last_seq.pop(client_id, None)
+
+    def mix(self, listeners):
+        """
+        Take the oldest block of every speaker and build each listener's mix.
+
+        :param listeners: iterable of client_id of the audio receivers
+        :return: (dict client_id -> bytes, timestamp of the oldest block mixed), or None if nobody spoke
+        """
+        active = [(client_id, queue.popleft()) for client_id, queue in self.sources.items() if queue]
+        if not active:
+            return None
+        blocks = np.stack([block for _, (_, _, block) in active]).astype(np.int32)  # speakers x samples
+        total = blocks.sum(axis=0)
+        full_mix = np.clip(total, -32768, 32767).astype(np.int16).tobytes()
+        without_self = np.clip(total - blocks, -32768, 32767).astype(np.int16)  # N-1 mix of each speaker
+        speaker_index = {}
+        for i, (client_id, (seq, _, _)) in enumerate(active):
+            speaker_index[client_id] = i
+            self.last_seq[client_id] = seq
+
+        mixes = {}
+        for listener in listeners:
+            i = speaker_index.get(listener)
+            if i is None:
+                mixes[listener] = full_mix
+            elif len(active) > 1:  # 只有自己在说话时不用发送静音
+                mixes[listener] = without_self[i].tobytes()
+        return mixes, min(timestamp for _, (_, timestamp, _) in active)
+
+
+class StreamingDenoiser:
+    def __init__(self, rate=RATE, fft_size=DENOISE_FFT_SIZE):
+        """
+        Stateful spectral-subtraction noise suppressor for a stream of int16 blocks.
+        The noise spectrum follows the smoothed power across blocks (fast down, slow up), frames are
+        processed with 50% overlap-add and a precomputed sqrt-Hann window, and all frames
+        of a block go through one vectorized FFT. Output lags input by fft_size / 2 samples.
+
+        :param rate: sampling rate, used to report the real-time factor
+        :param fft_size: FFT frame length, blocks must be a multiple of fft_size / 2
+        """
+        self.rate = rate
+        self.fft_size = fft_size
+        self.hop = fft_size // 2
+        # sqrt-Hann 分析+合成窗, 50% 重叠时平方和为 1
+        self.window = np.sqrt(np.hanning(fft_size + 1)[:-1])
+        self.tail_in = np.zeros(fft_size - self.hop)
+        self.tail_out = np.zeros(fft_size - self.hop)
+        self.noise = None  # running noise power per frequency bin
+        self.smoothed = None  # recursively smoothed power per frequency bin
+        self.gain = np.ones(fft_size // 2 + 1)
+        self.power_smoothing = 0.7
+        self.noise_fall = 0.8  # 噪声估计下降快
+        self.noise_rise = 0.999  # 上升慢, 避免把语音当成噪声
+        self.over_subtraction = 2.5
+        self.gain_floor = 0.1
+
+        self.blocks = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.samples = 0
+
+    def process(self, block):
+        """
+        :param block: np.ndarray of int16 samples
+        :return: np.ndarray of int16 samples, same length
+        """
+        started = time.perf_counter()
+        length = len(block)
+        if length % self.hop:
+            return block
+        signal = np.concatenate((self.tail_in, block.astype(np.float64)))
+        num_frames = length // self.hop
+        starts = np.arange(num_frames) * self.hop
+        frames = signal[starts[:, None] + np.arange(self.fft_size)] * self.window
+        spectrum = np.fft.rfft(frames, axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+
+        gains = np.empty_like(power)
+        for i in range(num_frames):
+            if self.noise is None:
+                self.noise = power[i].copy()
+                self.smoothed = power[i].copy()
+            self.smoothed = self.power_smoothing * self.smoothed + (1 - self.power_smoothing) * power[i]
+            falling = self.smoothed < self.noise
+            self.noise = np.where(falling,
+                                  self.noise_fall * self.noise + (1 - self.noise_fall) * self.smoothed,
+                                  self.noise_rise * self.noise + (1 - self.noise_rise) * self.smoothed)
+            gain = np.maximum(1 - self.over_subtraction * self.noise / np.maximum(power[i], 1e-10), self.gain_floor)
+            self.gain = 0.5 * self.gain + 0.5 * gain  # 平滑增益, 减少 musical noise
+            gains[i] = self.gain
+        frames = np.fft.irfft(spectrum * gains, n=self.fft_size, axis=1) * self.window
+
+        output = np.zeros(length + self.fft_size - self.hop)
+        output[:len(self.tail_out)] += self.tail_out
+        for i, start in enumerate(starts):
+            output[start:start + self.fft_size] += frames[i]
+        self.tail_out = output[length:]
+        self.tail_in = signal[-len(self.tail_in):]
+
+        elapsed = time.perf_counter() - started
+        self.blocks += 1
+        self.samples += length
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        return np.clip(output[:length], -32768, 32767).astype(np.int16)
+
+    def get_stats(self):
+        """
+        :return: dict, per-block cost and real-time factor (processing time / audio duration)
+        """
+        if not self.blocks:
+            return {'blocks': 0}
+        return {
+            'blocks': self.blocks,
+            'avg_ms': round(self.total_time / self.blocks * 1000, 3),
+            'max_ms': round(self.max_time * 1000, 3),
+            'realtime_factor': round(self.total_time / (self.samples / self.rate), 4),
+        }
+
+
+class JitterBuffer:
+    def __init__(self, block_duration=CHUNK / RATE, min_blocks=JITTER_MIN_BLOCKS, max_blocks=JITTER_MAX_BLOCKS):
+        """
+        Reorder received audio blocks by sequence number and release them at a steady pace.
+        The target depth follows the measured interarrival jitter (RFC 3550 estimator);
+        missing blocks are concealed and a buffer grown past its target is shortened by
+        skipping a quiet block. put() is called from the event loop, get() from the playout thread.
+
+        :param block_duration: seconds of audio in one block
+        :param min_blocks: smallest target depth
+        :param max_blocks: largest target depth
+        """
+        self.block_duration = block_duration
+        self.min_blocks = min_blocks
+        self.max_blocks = max_blocks
+        self.lock = threading.Lock()
+        self.blocks = {}  # seq: np.ndarray (int16)
+        self.next_seq = None
+        self.playing = False
+        self.last_block = None
+        self.concealing = 0
+        self.jitter = 0.0
+        self.last_transit = None
+        self.target = min_blocks
+        self.stats = {'received': 0, 'late': 0, 'concealed': 0, 'compressed': 0, 'underruns': 0}
+
+    def put(self, seq, timestamp, payload):
+        block = np.frombuffer(payload, dtype=np.int16)
+        with self.lock:
+            transit = time.time() - timestamp
+            if self.last_transit is not None:
+                self.jitter += (abs(transit - self.last_transit) - self.jitter) / 16
+            self.last_transit = transit
+            self.target = min(max(math.ceil(3 * self.jitter / self.block_duration) + 1, self.min_blocks),
+                              self.max_blocks)
+            if self.next_seq is not None and seq < self.next_seq:
+                self.stats['late'] += 1
+                return
+            self.blocks[seq] = block
+            self.stats['received'] += 1
+
+    def get(self):
+        """
+        :return: np.ndarray, the next block to play, or None when there is nothing to play
+        """
+        with self.lock:
+            if not self.playing:
+                if len(self.blocks) < self.target:
+                    return None
+                self.playing = True
+                self.next_seq = min(self.blocks)
+            if not self.blocks:  # 缓冲区耗尽, 重新预缓冲
+                self.playing = False
+                self.stats['underruns'] += 1
+                return None
+            if self.next_seq not in self.blocks and min(self.blocks) - self.next_seq > self.max_blocks:
+                self.next_seq = min(self.blocks)  # 序号跳变太大, 直接跟上
+            if len(self.blocks) > self.target + 2 and self.next_seq in self.blocks \
+                    and self.next_seq + 1 in self.blocks:  # 积压过多: 跳过两块中较安静的一块
+                first, second = self.blocks[self.next_seq], self.blocks[self.next_seq + 1]
+                skip = self.next_seq if np.abs(first).mean() <= np.abs(second).mean() else self.next_seq + 1
+                del self.blocks[skip]
+                if skip == self.next_seq:
+                    self.next_seq += 1
+                self.stats['compressed'] += 1
+            block = self.blocks.pop(self.next_seq, None)
+            self.next_seq += 1
+            if block is None:  # 丢块: 重复上一块并衰减, 连续丢失则静音
+                self.stats['concealed'] += 1
+                self.concealing += 1
+                if self.last_block is None or self.concealing > 2:
+                    return np.zeros(len(self.last_block) if self.last_block is not None else CHUNK, np.int16)
+                return (self.last_block * (0.5 ** self.concealing)).astype(np.int16)
+            self.concealing = 0
+            self.last_block = block
+            return block
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, depth=len(self.blocks), target=self.target,
+                        jitter_ms=round(self.jitter * 1000, 2))
+
+
+class AudioPlayout:
+    def __init__(self, stream, block_size=CHUNK, process=None):
+        """
+        Playout thread: pulls one block per sender from its JitterBuffer, mixes them and writes
+        to the output stream. The blocking stream.write paces the loop at the device clock,
+        and silence is written while nothing is buffered.
+
+        :param stream: pyaudio output stream
+        :param block_size: samples per block
+        :param process: optional callable applied to each mixed int16 block (e.g. denoiser.process)
+        """
+        self.stream = stream
+        self.block_size = block_size
+        self.process = process
+        self.buffers = {}  # sender id: JitterBuffer
+        self.running = False
+        self.thread = None
+
+    def put(self, sender, seq, timestamp, payload):
+        buffer = self.buffers.get(sender)
+        if buffer is None:
+            buffer = self.buffers[sender] = JitterBuffer(block_duration=self.block_size / RATE)
+        buffer.put(seq, timestamp, payload)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='audio-playout', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def run(self):
+        silence = bytes(self.block_size * 2)
+        while self.running:
+            blocks = [block for block in (buffer.get() for buffer in list(self.buffers.values()))
+                      if block is not None]
+            if not blocks:
+                self.stream.write(silence)
+                continue
+            if len(blocks) == 1:
+                mixed = blocks[0]
+            else:
+                mixed = np.clip(np.sum([block.astype(np.int32) for block in blocks], axis=0),
+                                -32768, 32767).astype(np.int16)
+            if self.process:
+                mixed = self.process(mixed)
+            self.stream.write(mixed.tobytes())
+
+    def get_stats(self):
+        return {sender: buffer.get_stats() for sender, buffer in self.buffers.items()}
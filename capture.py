@@ -0,0 +1,108 @@
+# 采集线程: 麦克风/摄像头/屏幕的阻塞读取放在独立线程中, 不再阻塞事件循环
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class CaptureSource:
+    def __init__(self, name, capture_function, fps=None, depth=1):
+        """
+        Run one blocking capture function in its own thread and hand results to asyncio.
+
+        :param name: str, source name used in logs ('audio', 'video', 'screen')
+        :param capture_function: blocking callable returning one frame / audio block
+        :param fps: target capture rate; None lets the blocking call pace itself (audio)
+        :param depth: 1 keeps only the latest value, more keeps a ring of the newest values
+        """
+        self.name = name
+        self.capture_function = capture_function
+        self.fps = fps
+        self.frames = deque(maxlen=depth)  # (value, capture start, capture end); append/popleft are atomic
+        self.loop = None
+        self.ready = asyncio.Event()
+        self.running = False
+        self.thread = None
+
+        self.captured = 0
+        self.overwritten = 0
+        self.errors = 0
+        self.capture_time = 0.0
+        self.max_capture_time = 0.0
+        self.started_at = None
+
+    def start(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.running = True
+        self.started_at = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name=f'capture-{self.name}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop capturing (the thread exits after its current read) and wake up a pending get().
+        Must be called from the event loop thread.
+        """
+        self.running = False
+        self.ready.set()
+
+    def run(self):
+        next_time = time.perf_counter()
+        while self.running:
+            started = time.perf_counter()
+            stamp = time.time()
+            try:
+                frame = self.capture_function()
+            except Exception as e:
+                self.errors += 1
+                print(f"[Error] Capture {self.name} failed: {e}")
+                time.sleep(0.1)
+                continue
+            elapsed = time.perf_counter() - started
+            self.captured += 1
+            self.capture_time += elapsed
+            self.max_capture_time = max(self.max_capture_time, elapsed)
+            if len(self.frames) == self.frames.maxlen:
+                self.overwritten += 1
+            self.frames.append((frame, stamp, time.time()))
+            try:
+                self.loop.call_soon_threadsafe(self.ready.set)
+            except RuntimeError:  # 事件循环已关闭
+                break
+            if self.fps:
+                next_time += 1 / self.fps
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.perf_counter()  # 采集跟不上目标帧率, 不补采
+
+    async def get(self):
+        """
+        :return: the oldest captured value not yet taken (the latest one when depth is 1),
+                 or None once the source is stopped
+        """
+        stamped = await self.get_stamped()
+        return stamped[0] if stamped else None
+
+    async def get_stamped(self):
+        """
+        :return: (value, capture start, capture end) in time.time() seconds, or None once the source is stopped
+        """
+        while not self.frames:
+            if not self.running:
+                return None
+            self.ready.clear()
+            await self.ready.wait()
+        return self.frames.popleft()
+
+    def get_stats(self):
+        duration = time.perf_counter() - self.started_at if self.started_at else 0
+        return {
+            'captured': self.captured,
+            'overwritten': self.overwritten,
+            'errors': self.errors,
+            'fps': round(self.captured / duration, 2) if duration else 0,
+            'avg_capture_ms': round(self.capture_time / self.captured * 1000, 3) if self.captured else 0,
+            'max_capture_ms': round(self.max_capture_time * 1000, 3),
+        }
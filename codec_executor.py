@@ -0,0 +1,85 @@
+# 图像编解码与合成的工作池, 避免 PIL 的 CPU 计算阻塞 asyncio 事件循环
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from config import CODEC_EXECUTOR, CODEC_WORKERS, CODEC_MAX_PENDING
+
+
+class CodecExecutor:
+    def __init__(self, mode=CODEC_EXECUTOR, workers=CODEC_WORKERS, max_pending=CODEC_MAX_PENDING):
+        """
+        Thread or process pool that image codec and compositing calls go through.
+
+        :param mode: 'thread' or 'process'; stateful calls always use the thread pool
+        :param workers: number of pool workers
+        :param max_pending: calls allowed in flight before run() makes callers wait
+        """
+        self.mode = mode
+        self.thread_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='codec')
+        self.process_pool = ProcessPoolExecutor(max_workers=workers) if mode == 'process' else None
+        self.max_pending = max_pending
+        self.pending = None  # asyncio.Semaphore, created on first use inside the running loop
+        self.in_flight = 0
+        self.metrics = {}  # task name: {'count', 'total', 'max', 'wait'}
+
+    async def run(self, fn, *args, stateful=False):
+        """
+        Run fn(*args) on the pool and await its result.
+
+        :param fn: callable; must be picklable (module level) in process mode unless stateful
+        :param stateful: True if fn mutates an object of this process (e.g. Compositor.compose)
+        :return: the result of fn(*args)
+        """
+        if self.pending is None:
+            self.pending = asyncio.Semaphore(self.max_pending)
+        queued = time.perf_counter()
+        async with self.pending:
+            started = time.perf_counter()
+            pool = self.thread_pool if stateful or self.process_pool is None else self.process_pool
+            self.in_flight += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            finally:
+                self.in_flight -= 1
+                self.record(getattr(fn, '__qualname__', repr(fn)), started - queued, time.perf_counter() - started)
+
+    def record(self, name, wait, elapsed):
+        metric = self.metrics.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'wait': 0.0})
+        metric['count'] += 1
+        metric['total'] += elapsed
+        metric['max'] = max(metric['max'], elapsed)
+        metric['wait'] += wait
+
+    def get_stats(self):
+        """
+        :return: dict, per task name: calls, average/max run time and average backpressure wait in ms
+        """
+        stats = {'mode': self.mode, 'in_flight': self.in_flight, 'tasks': {}}
+        for name, metric in self.metrics.items():
+            count = metric['count']
+            stats['tasks'][name] = {
+                'count': count,
+                'avg_ms': round(metric['total'] / count * 1000, 3),
+                'max_ms': round(metric['max'] * 1000, 3),
+                'wait_avg_ms': round(metric['wait'] / count * 1000, 3),
+            }
+        return stats
+
+    def shutdown(self):
+        self.thread_pool.shutdown(wait=False)
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False)
+
+
+codec_executor = None
+
+
+def get_codec_executor():
+    """
+    Shared CodecExecutor of this process, created on first use.
+    """
+    global codec_executor
+    if codec_executor is None:
+        codec_executor = CodecExecutor()
+    return codec_executor
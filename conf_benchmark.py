@@ -0,0 +1,584 @@
+# -- coding: utf-8 --**
+# python conf_benchmark.py --spawn --conferences 4 --participants 5 --duration 30
+# 无需麦克风/摄像头/显示器: 合成的参与者使用真实协议连接服务器, 统计延迟、吞吐和服务器资源占用
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from config import *
+from protocol import *
+from screen_delta import ScreenDeltaEncoder
+from udp_transport import MediaDatagramProtocol
+from core import Compositor, compress_layers, decompress_image, fit_size, overlay_camera_images
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DATA_TYPES = ['text', 'audio', 'video', 'screen']
+
+
+def synthetic_audio(seconds=1.0, frequency=440):
+    """
+    Sine tone cut into CHUNK-sample PCM blocks.
+
+    :return: list of bytes
+    """
+    samples = int(RATE * seconds) // CHUNK * CHUNK
+    tone = (np.sin(2 * np.pi * frequency * np.arange(samples) / RATE) * 3000).astype(np.int16)
+    return [tone[i:i + CHUNK].tobytes() for i in range(0, samples, CHUNK)]
+
+
+def synthetic_camera(frames=30, quality=CAMERA_QUALITY):
+    """
+    Gradient with a moving bar, JPEG-encoded once and replayed by every synthetic camera.
+
+    :return: list of bytes
+    """
+    x = np.linspace(0, 255, camera_width, dtype=np.uint8)
+    base = np.stack([np.tile(x, (camera_height, 1))] * 3, axis=-1)
+    encoded = []
+    for i in range(frames):
+        frame = base.copy()
+        left = i * camera_width // frames
+        frame[:, left:left + camera_width // 10] = (255, 64, 64)
+        buffer = BytesIO()
+        Image.fromarray(frame).save(buffer, format='JPEG', quality=quality)
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+def synthetic_screen(frames=20, path='screen.jpg'):
+    """
+    Recorded screen with a moving cursor-sized box, as keyframe + delta payloads.
+
+    :return: (keyframe (flags, payload), list of (flags, payload) deltas that loop back to the keyframe image)
+    """
+    screen = Image.open(path).convert('RGB')
+    images = []
+    for i in range(frames):
+        image = screen.copy()
+        left = 50 + i * (screen.width - 150) // frames
+        ImageDraw.Draw(image).rectangle([left, 100, left + 60, 160], fill=(30, 144, 255))
+        images.append(image)
+    encoder = ScreenDeltaEncoder(keyframe_interval=1 << 30)
+    keyframe = encoder.encode(images[0])
+    deltas = [encoder.encode(image) for image in images[1:] + images[:1]]
+    return keyframe, [delta for delta in deltas if delta]
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'count': len(values), 'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000, 'p99_ms': p99 * 1000,
+            'max_ms': max(values) * 1000}
+
+
+def read_process_usage(pid):
+    """
+    CPU seconds and resident memory of a local process (psutil if installed, else /proc).
+
+    :return: (cpu seconds, rss bytes) or None
+    """
+    try:
+        if psutil:
+            process = psutil.Process(pid)
+            times = process.cpu_times()
+            return times.user + times.system, process.memory_info().rss
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        return cpu, int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return None
+
+
+class ServerSampler:
+    def __init__(self, pids, interval=1.0):
+        """
+        Sample CPU and memory of the server processes (main server and its workers) while the benchmark runs.
+        """
+        self.pids = pids
+        self.interval = interval
+        self.samples = []  # (cpu percent, rss bytes), summed over pids
+
+    async def run(self):
+        previous = {pid: read_process_usage(pid) for pid in self.pids}
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            elapsed = time.perf_counter() - start
+            cpu, rss = 0.0, 0
+            for pid in self.pids:
+                usage = read_process_usage(pid)
+                if usage is None or previous.get(pid) is None:
+                    continue
+                cpu += (usage[0] - previous[pid][0]) / elapsed * 100
+                rss += usage[1]
+                previous[pid] = usage
+            self.samples.append((cpu, rss))
+
+    def get_stats(self):
+        if not self.samples:
+            return {}
+        cpu = [sample[0] for sample in self.samples]
+        rss = [sample[1] for sample in self.samples]
+        return {'cpu_avg_percent': float(np.mean(cpu)), 'cpu_max_percent': max(cpu),
+                'rss_max_mb': max(rss) / 2 ** 20}
+
+
+class SyntheticClient:
+    def __init__(self, index, host, port, media, transport='tcp', viewport=None, simulcast=False):
+        """
+        Headless participant speaking the real client protocol.
+
+        :param media: data types this participant shares, subset of ('audio', 'video', 'screen')
+        :param viewport: (width, height) announced to the server to pick a canvas tier, the full canvas if None
+        :param simulcast: create relay-mode conferences and publish every simulcast camera layer
+        """
+        self.index = index
+        self.host = host
+        self.port = port
+        self.media = media
+        self.transport = transport
+        self.viewport = viewport
+        self.simulcast = simulcast
+        self.reader = None
+        self.writer = None
+        self.response = {}
+        self.data_connections = {}  # data_type: (reader, writer)
+        self.send_tasks = []
+        self.receive_tasks = []
+        self.running = False
+        self.control_latency = {}  # action: seconds
+        self.latency = {data_type: [] for data_type in DATA_TYPES}  # seconds from send/capture to receipt
+        # compose mode: seconds from the server stamping a composite to receipt, not comparable with the above
+        self.server_latency = {data_type: [] for data_type in DATA_TYPES}
+        self.received = {data_type: [0, 0] for data_type in DATA_TYPES}  # frames, bytes
+        self.sent = {data_type: [0, 0] for data_type in DATA_TYPES}
+        self.text_sent = {}  # text id: send time
+
+    async def request(self, message):
+        start = time.perf_counter()
+        self.writer.write((json.dumps(message) + '\n').encode())
+        await self.writer.drain()
+        response = json.loads((await self.reader.readline()).decode())
+        self.control_latency[message['action']] = time.perf_counter() - start
+        return response
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def create(self):
+        message = {'action': 'create', 'transport': self.transport}
+        if self.simulcast:
+            message.update({'video_mode': 'relay', 'simulcast': True})
+        self.response = await self.request(message)
+        return self.response.get('conference_id')
+
+    async def join(self, conference_id):
+        self.response = await self.request({'action': 'join', 'conference_id': conference_id,
+                                            'transport': self.transport, 'simulcast': self.simulcast})
+
+    async def open_data_connections(self):
+        conference_id = self.response['conference_id']
+        data_addr = self.response.get('data_addr', self.host)
+        udp_ports = self.response.get('udp_ports') or {}
+        for data_type in DATA_TYPES:
+            handshake = json.dumps({'conference_id': conference_id, 'data_type': data_type})
+            if data_type in udp_ports:
+                _, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+                    MediaDatagramProtocol, remote_addr=(data_addr, udp_ports[data_type]))
+                write_frame(protocol.writer, FRAME_HELLO, handshake.encode())
+                self.data_connections[data_type] = (protocol.reader, protocol.writer)
+                continue
+            reader, writer = await asyncio.open_connection(data_addr, self.response['ports'][data_type])
+            if self.response.get('multiplexed'):
+                writer.write((handshake + '\n').encode())
+                await writer.drain()
+                await reader.readline()
+            self.data_connections[data_type] = (reader, writer)
+        hello = {}
+        if self.viewport:
+            hello['viewport'] = list(self.viewport)
+        if self.response.get('simulcast'):
+            hello['simulcast'] = True  # 在第一帧之前告诉服务器我们发布几层
+        if hello and 'video' in self.data_connections:
+            write_frame(self.data_connections['video'][1], FRAME_HELLO, json.dumps(hello).encode())
+
+    def start(self, audio, camera, screen, fps):
+        self.running = True
+        for data_type in DATA_TYPES:
+            self.receive_tasks.append(asyncio.create_task(self.receive(data_type)))
+        if 'audio' in self.media:
+            self.send_tasks.append(asyncio.create_task(
+                self.share('audio', [(0, block) for block in audio], CHUNK / RATE)))
+        if 'video' in self.media:
+            if self.response.get('simulcast'):
+                camera = [compress_layers(decompress_image(frame)) for frame in camera]
+            else:
+                camera = [(0, frame) for frame in camera]
+            self.send_tasks.append(asyncio.create_task(self.share('video', camera, 1 / fps)))
+        if 'screen' in self.media:
+            keyframe, deltas = screen
+            self.send_tasks.append(asyncio.create_task(self.share('screen', deltas, 1 / fps, keyframe)))
+        self.send_tasks.append(asyncio.create_task(self.chat()))
+
+    async def share(self, data_type, frames, interval, first=None):
+        """
+        Send frames in a loop at a fixed rate, stamped with the send time.
+        """
+        writer = self.data_connections[data_type][1]
+        frame_type = FRAME_TYPES[data_type]
+        seq = 0
+        next_time = time.perf_counter()
+        while self.running:
+            frame = first if seq == 0 and first else frames[seq % len(frames)]
+            # list: simulcast layers, which share the seq of their captured frame like in the real clients
+            for flags, payload in frame if isinstance(frame, list) else [frame]:
+                write_frame(writer, frame_type, payload, seq=seq, flags=flags)
+                self.sent[data_type][0] += 1
+                self.sent[data_type][1] += len(payload)
+            await writer.drain()
+            seq += 1
+            next_time += interval
+            await asyncio.sleep(max(0.0, next_time - time.perf_counter()))
+
+    async def chat(self, interval=1.0):
+        writer = self.data_connections['text'][1]
+        text_id = 0
+        while self.running:
+            text_id += 1
+            self.text_sent[f'{self.index}-{text_id}'] = time.time()
+            writer.write((json.dumps({'data': f'{self.index}-{text_id}'}) + '\n').encode())
+            await writer.drain()
+            self.sent['text'][0] += 1
+            await asyncio.sleep(interval)
+
+    async def receive(self, data_type):
+        reader = self.data_connections[data_type][0]
+        try:
+            while True:
+                if data_type == 'text':
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    message = json.loads(line.decode())
+                    sent = self.text_sent.pop(str(message.get('data')), None)
+                    if sent:
+                        self.latency['text'].append(time.time() - sent)
+                    self.received['text'][0] += 1
+                    self.received['text'][1] += len(line)
+                    continue
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                header, payload = frame
+                if not payload:
+                    continue
+                # 合成画面 (sender 0) 的时间戳是服务器合成时给出的, 只能算服务器到客户端的延迟;
+                # 混音和中继的帧带着发送端的采集时间
+                if data_type == 'video' and header.sender == 0:
+                    self.server_latency[data_type].append(time.time() - header.timestamp)
+                else:
+                    self.latency[data_type].append(time.time() - header.timestamp)
+                self.received[data_type][0] += 1
+                self.received[data_type][1] += len(payload)
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+
+    def stop(self):
+        self.running = False
+        for task in self.send_tasks:
+            task.cancel()
+
+    async def quit(self):
+        cids = {}
+        for data_type, (_, writer) in self.data_connections.items():
+            addr = writer.get_extra_info('sockname')
+            cids[data_type] = f'{addr[0]}:{addr[1]}'
+        await self.request({'action': 'quit', 'conference_id': self.response.get('conference_id'), 'cids': cids})
+        for task in self.receive_tasks:
+            task.cancel()
+        for _, writer in self.data_connections.values():
+            writer.close()
+
+    async def cancel(self):
+        await self.request({'action': 'cancel', 'conference_id': self.response.get('conference_id')})
+
+    async def close(self):
+        self.writer.close()
+
+
+COLD_START_SCRIPT = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+      ' '.join(m for m in ('pyaudio', 'cv2', 'pyautogui', 'PyQt5', 'av') if m in sys.modules))
+"""
+
+
+def measure_cold_start(modules=('core', 'conf_serverTCP', 'util'), runs=3):
+    """
+    Import time and peak RSS of each module in a fresh interpreter, and which device/GUI libraries it pulled in.
+    """
+    result = {}
+    for module in modules:
+        times, rss, loaded = [], 0, ''
+        for _ in range(runs):
+            process = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT.format(module=module)],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+            if process.returncode != 0:
+                print(f"{module:>14}: import failed: {process.stderr.strip().splitlines()[-1]}")
+                break
+            fields = process.stdout.split(maxsplit=2)
+            times.append(float(fields[0]))
+            rss = max(rss, int(fields[1]) * 1024)  # ru_maxrss 在 Linux 上以 KB 为单位
+            loaded = fields[2].strip() if len(fields) > 2 else ''
+        if times:
+            result[module] = {'import_ms': min(times) * 1000, 'rss_mb': rss / 2 ** 20, 'loaded': loaded}
+            print(f"{module:>14}: import {min(times) * 1000:7.1f} ms, rss {rss / 2 ** 20:6.1f} MB"
+                  + (f", loads {loaded}" if loaded else ''))
+    return result
+
+
+def legacy_overlay(screen_image, camera_images, my_screen_size):
+    """
+    The PIL compositor replaced by the NumPy/cv2 one (LANCZOS fit, LANCZOS resize and paste of every camera),
+    kept as the baseline of measure_compose.
+    """
+    display_image = screen_image.resize(fit_size(screen_image.size, my_screen_size), Image.LANCZOS)
+    camera_width, camera_height = camera_images[0].size
+    num_cameras_per_row = max(display_image.width // camera_width, 1)
+    for i, camera_image in enumerate(camera_images):
+        camera_image = camera_image.resize((int(camera_width * 0.6), int(camera_height * 0.6)), Image.LANCZOS)
+        x = int(i % num_cameras_per_row * camera_width * 0.8 + camera_width * 0.7)
+        y = int(i // num_cameras_per_row * camera_height * 0.8)
+        display_image.paste(camera_image, (x, y))
+    return display_image
+
+
+def measure_compose(participants=(1, 4, 9, 16), frames=30, screen_path='screen.jpg'):
+    """
+    Time per composite frame of the old PIL overlay, the cv2 overlay_camera_images and the incremental
+    Compositor (every camera sends a new frame, or only one does), at CANVAS_SIZE.
+    The old overlay fits the screen again every frame, so the headline speedup compares it with a Compositor
+    that also gets a new screen every frame; the gain of the cached screen is printed separately.
+    """
+    screen = Image.open(screen_path).convert('RGB')
+    cameras = [decompress_image(data) for data in synthetic_camera(frames)]
+    background = Image.open('black.jpg')
+    result = {}
+    for count in participants:
+        def all_cameras(i):
+            return [cameras[(i + k) % frames] for k in range(count)]
+
+        def compositor_run(changed, new_screen=False):
+            compositor = Compositor(background, CANVAS_SIZE)
+            compositor.set_screen(screen)
+            for k in range(count):
+                compositor.set_camera(k, cameras[k % frames])
+            compositor.compose()
+
+            def tick(i):
+                if new_screen:  # 共享屏幕每帧都在变化, 与旧实现同样要重新缩放屏幕
+                    compositor.set_screen(screen)
+                for k in range(changed):
+                    compositor.set_camera((i + k) % count, cameras[(i + k) % frames])
+                compositor.compose()
+            return tick
+
+        cases = {
+            'pil overlay': lambda i: legacy_overlay(screen, all_cameras(i), CANVAS_SIZE),
+            'cv2 overlay': lambda i: overlay_camera_images(screen, all_cameras(i), CANVAS_SIZE),
+            'compositor, new screen': compositor_run(count, new_screen=True),
+            'compositor, all new': compositor_run(count),
+            'compositor, one new': compositor_run(1),
+        }
+        result[count] = {}
+        for name, tick in cases.items():
+            tick(0)  # 预热
+            start = time.perf_counter()
+            for i in range(frames):
+                tick(i)
+            result[count][name] = (time.perf_counter() - start) / frames * 1000
+        times = result[count]
+        print(f"{count:>2} cameras: " + ', '.join(f"{name} {ms:6.2f} ms" for name, ms in times.items())
+              + f" (pil / compositor {times['pil overlay'] / times['compositor, new screen']:.1f}x like for like, "
+                f"pil / cv2 overlay {times['pil overlay'] / times['cv2 overlay']:.1f}x, "
+                f"{times['pil overlay'] / times['compositor, all new']:.1f}x with the screen cached)")
+    return result
+
+
+async def wait_for_server(host, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return True
+        except OSError:
+            await asyncio.sleep(0.2)
+    return False
+
+
+async def server_pids(host, port):
+    """
+    Pids of the main server and its workers, from the 'load' and 'workers' actions.
+    """
+    client = SyntheticClient(-1, host, port, ())
+    await client.connect()
+    pids = [(await client.request({'action': 'load'})).get('load', {}).get('pid')]
+    workers = (await client.request({'action': 'workers'})).get('workers', [])
+    pids += [worker.get('pid') for worker in workers]
+    await client.close()
+    return [pid for pid in pids if pid]
+
+
+async def run_benchmark(args):
+    host, port = args.host, args.port
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, 'conf_serverTCP.py'],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  stdout=subprocess.DEVNULL if args.quiet else None)
+    if not await wait_for_server(host, port):
+        print(f'[Error] Server {host}:{port} is not reachable.')
+        return None
+    try:
+        audio, camera, screen = synthetic_audio(), synthetic_camera(), synthetic_screen()
+        sampler = ServerSampler(await server_pids(host, port))
+        sampler_task = asyncio.create_task(sampler.run())
+
+        conferences = []  # list of [SyntheticClient]
+        for conference in range(args.conferences):
+            clients = []
+            for participant in range(args.participants):
+                media = set(args.media)
+                if participant != 0:
+                    media.discard('screen')  # 每个会议只有第一个人共享屏幕
+                client = SyntheticClient(len(conferences) * args.participants + participant, host, port,
+                                         media, args.transport, args.viewport, args.simulcast)
+                await client.connect()
+                if participant == 0:
+                    conference_id = await client.create()
+                    if conference_id is None:
+                        print(f'[Error] Create failed: {client.response}')
+                        return None
+                else:
+                    await client.join(conference_id)
+                await client.open_data_connections()
+                clients.append(client)
+            conferences.append(clients)
+        print(f'{args.conferences} conferences x {args.participants} participants connected, '
+              f'running for {args.duration}s...')
+
+        start = time.perf_counter()
+        for clients in conferences:
+            for client in clients:
+                client.start(audio, camera, screen, args.fps)
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - start
+        for clients in conferences:
+            for client in clients:
+                client.stop()
+        sampler_task.cancel()
+
+        for clients in conferences:
+            for client in clients:
+                await client.quit()
+            await clients[0].cancel()
+            for client in clients:
+                await client.close()
+        return report([client for clients in conferences for client in clients], elapsed, sampler, args)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+def report(clients, elapsed, sampler, args):
+    result = {'conferences': args.conferences, 'participants': args.participants, 'duration_s': elapsed,
+              'transport': args.transport, 'media': {}, 'control': {}}
+    for data_type in DATA_TYPES:
+        latency = [value for client in clients for value in client.latency[data_type]]
+        server_latency = [value for client in clients for value in client.server_latency[data_type]]
+        received = np.sum([client.received[data_type] for client in clients], axis=0)
+        sent = np.sum([client.sent[data_type] for client in clients], axis=0)
+        result['media'][data_type] = {
+            'sent_fps': sent[0] / elapsed,
+            'received_fps': received[0] / elapsed,
+            'received_mbps': received[1] * 8 / elapsed / 1e6,
+            'latency': percentiles(latency),
+            'server_latency': percentiles(server_latency),
+        }
+    for action in ('create', 'join', 'quit', 'cancel'):
+        result['control'][action] = percentiles(
+            [client.control_latency[action] for client in clients if action in client.control_latency])
+    result['server'] = sampler.get_stats()
+    if result['server']:
+        result['server']['cpu_percent_per_conference'] = result['server']['cpu_avg_percent'] / args.conferences
+        result['server']['rss_mb_per_conference'] = result['server']['rss_max_mb'] / args.conferences
+
+    for data_type, stats in result['media'].items():
+        latency, server_latency = stats['latency'], stats['server_latency']
+        print(f"{data_type:>6}: sent {stats['sent_fps']:8.1f} f/s, received {stats['received_fps']:8.1f} f/s "
+              f"{stats['received_mbps']:7.2f} Mbit/s"
+              + (f", end-to-end latency p50 {latency['p50_ms']:.1f} p95 {latency['p95_ms']:.1f} "
+                 f"p99 {latency['p99_ms']:.1f} ms" if latency else '')
+              + (f", server→client latency (composite) p50 {server_latency['p50_ms']:.1f} "
+                 f"p95 {server_latency['p95_ms']:.1f} p99 {server_latency['p99_ms']:.1f} ms" if server_latency else ''))
+    for action, latency in result['control'].items():
+        if latency:
+            print(f"{action:>6}: p50 {latency['p50_ms']:.1f} p99 {latency['p99_ms']:.1f} ms")
+    if result['server']:
+        print(f"server: cpu {result['server']['cpu_avg_percent']:.1f}% avg / "
+              f"{result['server']['cpu_max_percent']:.1f}% max, rss {result['server']['rss_max_mb']:.1f} MB, "
+              f"{result['server']['cpu_percent_per_conference']:.1f}% cpu per conference")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, default=float)
+        print(f'Result written to {args.output}')
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test conf_serverTCP.py with synthetic participants.')
+    parser.add_argument('--host', default=SERVER_IP)
+    parser.add_argument('--port', type=int, default=MAIN_SERVER_PORT)
+    parser.add_argument('--spawn', action='store_true', help='start conf_serverTCP.py for the run')
+    parser.add_argument('--quiet', action='store_true', help="hide the spawned server's output")
+    parser.add_argument('--conferences', type=int, default=1)
+    parser.add_argument('--participants', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--fps', type=float, default=15, help='camera and screen frame rate')
+    parser.add_argument('--media', nargs='*', default=['audio', 'video', 'screen'],
+                        choices=['audio', 'video', 'screen'])
+    parser.add_argument('--transport', default='tcp', choices=['tcp', 'udp'])
+    parser.add_argument('--viewport', type=lambda value: tuple(int(v) for v in value.lower().split('x')),
+                        help='WIDTHxHEIGHT the participants display the composite at, e.g. 640x480')
+    parser.add_argument('--simulcast', action='store_true',
+                        help='relay-mode conferences where every camera publishes SIMULCAST_LAYERS')
+    parser.add_argument('--output', help='write the result as JSON, for comparing runs')
+    parser.add_argument('--cold-start', action='store_true',
+                        help='only measure import time and memory of the server and client modules')
+    parser.add_argument('--compose', action='store_true',
+                        help='only time the compositor against the old PIL overlay, no server needed')
+    args = parser.parse_args()
+    if args.cold_start:
+        measure_cold_start()
+    elif args.compose:
+        measure_compose()
+    else:
+        asyncio.run(run_benchmark(args))
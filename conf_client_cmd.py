@@ -29,8 +29,29 @@ class ConferenceClient:
 
         self.data_connections = {}  # data_type: (reader, writer)
         self.DATA_SERVER_PORT_MAPPING = {}
-
-        self.audio_buffer = None
+        self.send_seq = {}  # data_type: next seq of outgoing media frames
+        self.video_mode = VIDEO_MODE  # decided by the server in the create/join response
+        self.capture_stamps = {}  # data_type: (capture start, capture end) of the last value from capture_data
+        self.tracer = FrameTracer() if TRACE_FRAMES else None  # per-stage latency of received camera frames
+        self.relay_cameras = {}  # relay mode: sender id -> latest camera frame (PIL)
+        self.relay_screen = None  # relay mode: latest shared screen (PIL)
+        self.relay_background = None
+        self.viewport = None  # (width, height) the composite is shown at, the local display if None, picks the server's canvas tier
+        self.denoiser = StreamingDenoiser() if DENOISE_AT in ('sender', 'receiver') else None
+
+        self.audio_playout = None  # AudioPlayout, jitter buffers + device-paced playout thread
+        self.capture_sources = {}  # data_type: CaptureSource, capture thread of each shared data type
+        self.screen_encoder = None  # ScreenDeltaEncoder of our own screen share
+        self.rate_controllers = {}  # data_type: RateController of the video/screen connection
+        self.video_codec = 'jpeg'  # camera codec negotiated in the create/join response
+        self.simulcast = False  # publish SIMULCAST_LAYERS of our camera, granted in the create/join response
+        self.UDP_PORT_MAPPING = {}  # data_type: port, audio/video go over UDP when the server granted it
+        self.multiplexed = False  # data connections share one server port and start with a handshake
+        self.data_addr = SERVER_IP  # host of the data ports, a worker process in multi-process mode
+        self.video_encoder = None  # VideoEncoder of our own camera (inter-frame codecs only)
+        self.video_decoders = {}  # sender id: VideoDecoder (relay mode, inter-frame codecs only)
+        self.keyframe_requests = {}  # sender id: time we last asked the server for its keyframe
+        self.screen_canvases = {}  # sender id: ScreenCanvas (relay mode)
         self.video_buffer = None
 
     async def open_connection(self):
@@ -46,15 +67,58 @@ class ConferenceClient:
             # Assuming each data_type has a unique port or same port differentiated by protocol
             # Replace DATA_SERVER_PORT_aMAPPING with actual port mapping if needed
 
+            if data_type in self.UDP_PORT_MAPPING:
+                await self.open_datagram_connection(data_type)
+                return
             port = self.DATA_SERVER_PORT_MAPPING.get(data_type, MAIN_SERVER_PORT)
 
-            reader, writer = await asyncio.open_connection(self.server_addr, port)
+            reader, writer = await asyncio.open_connection(self.data_addr, port)
+            if self.multiplexed:
+                writer.write((self.data_handshake(data_type) + '\n').encode())
+                await writer.drain()
+                response = json.loads((await reader.readline()).decode())
+                if response.get('status') != 'success':
+                    writer.close()
+                    raise ConnectionError(response.get('message'))
             self.data_connections[data_type] = (reader, writer)
 
             print(f"Data connection for '{data_type}' established on port {port}.")
         except Exception as e:
             print(f"[Error] Failed to open connection for {data_type}: {e}")
 
+    def data_handshake(self, data_type):
+        """
+        First message of a data connection on the shared data port, telling the server where to route it.
+        """
+        return json.dumps({'conference_id': self.conference_id, 'data_type': data_type})
+
+    async def open_datagram_connection(self, data_type):
+        """
+        Open a UDP endpoint for audio/video; the (reader, writer) pair it yields behaves like a TCP one,
+        except that frames lost on the way are simply missing.
+        """
+        port = self.UDP_PORT_MAPPING[data_type]
+        loop = asyncio.get_running_loop()
+        _, protocol = await loop.create_datagram_endpoint(MediaDatagramProtocol, remote_addr=(self.data_addr, port))
+        # 让服务器先知道我们的地址, 不发送数据也能收到; 共用端口时服务器据此路由到会议
+        write_frame(protocol.writer, FRAME_HELLO, self.data_handshake(data_type).encode())
+        self.data_connections[data_type] = (protocol.reader, protocol.writer)
+        print(f"Datagram connection for '{data_type}' established on port {port}.")
+
+    async def send_viewport(self):
+        """
+        Tell the server how large we display the composite, so it sends the smallest canvas tier that covers it
+        (compose mode) or the smallest simulcast camera layer that is sharp enough (relay mode).
+        A granted simulcast is announced here too, before our first camera frame.
+        """
+        _, writer = self.data_connections['video']
+        viewport = self.viewport or get_screen_size()
+        message = {'viewport': list(viewport)}
+        if self.simulcast:
+            message['simulcast'] = True
+        write_frame(writer, FRAME_HELLO, json.dumps(message).encode())
+        await writer.drain()
+
     async def close_data_connections(self):
         """Close all data type connections."""
         for data_type, (reader, writer) in self.data_connections.items():
@@ -136,17 +200,70 @@ class ConferenceClient:
             print(f"[Error] Failed to read response: {e}")
             return None
 
+    async def send_frame(self, data_type, payload, writer, flags=0, seq=None):
+        """
+        Send one binary media frame (audio, video, screen) on its data connection.
+
+        :param seq: frame seq, the next one of the data type by default (see next_seq)
+        :return: float, seconds spent in drain(), or None if sending failed
+        """
+        if seq is None:
+            seq = self.next_seq(data_type)
+        write_frame(writer, FRAME_TYPES[data_type], payload, seq=seq, flags=flags)
+        started = time.perf_counter()
+        try:
+            await writer.drain()
+        except AssertionError as e:
+            print(f'[Dialog] Send frame failed: {e}')
+            return None
+        return time.perf_counter() - started
+
+    def next_seq(self, data_type):
+        """
+        :return: int, seq of the next captured frame of a data type; all its simulcast layers carry it
+        """
+        seq = self.send_seq.get(data_type, 0)
+        self.send_seq[data_type] = seq + 1
+        return seq
+
+    async def read_media_response(self, reader):
+        """
+        Read one binary media frame and wrap it like a text response.
+        """
+        frame = await read_frame(reader)
+        if frame is None:
+            raise asyncio.IncompleteReadError(b'', None)
+        header, payload = frame
+        return {
+            'data_type': FRAME_DATA_TYPES.get(header.frame_type),
+            'client_id': header.sender,
+            'data': payload,
+            'seq': header.seq,
+            'timestamp': header.timestamp,
+            'flags': header.flags,
+            'frame_type': header.frame_type,
+            'received': time.time(),
+        }
+
     async def create_conference(self):
         """
         Create a conference: send create-conference request to server and obtain necessary data.
         """
-        message = {'action': 'create'}
+        message = {'action': 'create', 'video_mode': VIDEO_MODE,
+                   'video_codec': VIDEO_CODEC, 'video_codecs': available_video_codecs(),
+                   'transport': MEDIA_TRANSPORT, 'simulcast': SIMULCAST}
         await self.send_request(message)
 
         response = await self.read_response()
         if response and response.get('status') == 'success':
             self.conference_id = response.get('conference_id')
             self.DATA_SERVER_PORT_MAPPING = response.get('ports')
+            self.video_mode = response.get('video_mode', 'compose')
+            self.video_codec = response.get('video_codec', 'jpeg')
+            self.simulcast = response.get('simulcast', False)
+            self.UDP_PORT_MAPPING = response.get('udp_ports') or {}
+            self.multiplexed = response.get('multiplexed', False)
+            self.data_addr = response.get('data_addr', self.server_addr)
             self.on_meeting = True
             self.is_creator = True
             print(f"Conference {self.conference_id} created successfully.")
@@ -158,7 +275,8 @@ class ConferenceClient:
         """
         Join a conference: send join-conference request with given conference_id.
         """
-        message = {'action': 'join', 'conference_id': conference_id}
+        message = {'action': 'join', 'conference_id': conference_id, 'video_codecs': available_video_codecs(),
+                   'transport': MEDIA_TRANSPORT, 'simulcast': SIMULCAST}
         await self.send_request(message)
 
         response = await self.read_response()
@@ -166,6 +284,12 @@ class ConferenceClient:
         if response and response.get('status') == 'success':
             self.conference_id = conference_id
             self.DATA_SERVER_PORT_MAPPING = response.get('ports')
+            self.video_mode = response.get('video_mode', 'compose')
+            self.video_codec = response.get('video_codec', 'jpeg')
+            self.simulcast = response.get('simulcast', False)
+            self.UDP_PORT_MAPPING = response.get('udp_ports') or {}
+            self.multiplexed = response.get('multiplexed', False)
+            self.data_addr = response.get('data_addr', self.server_addr)
             self.on_meeting = True
             print(f"Successfully joined conference {self.conference_id}.")
             await self.start_conference()
@@ -173,7 +297,8 @@ class ConferenceClient:
             print(f"[Error]: Failed to join conference {conference_id}.")
 
     async def quick_join_conference(self):
-        message = {'action': 'quickJoin'}
+        message = {'action': 'quickJoin', 'video_codecs': available_video_codecs(),
+                   'transport': MEDIA_TRANSPORT, 'simulcast': SIMULCAST}
         await self.send_request(message)
 
         response = await self.read_response()
@@ -181,6 +306,12 @@ class ConferenceClient:
         if response and response.get('status') == 'success':
             self.conference_id = int(response.get('conference_id'))
             self.DATA_SERVER_PORT_MAPPING = response.get('ports')
+            self.video_mode = response.get('video_mode', 'compose')
+            self.video_codec = response.get('video_codec', 'jpeg')
+            self.simulcast = response.get('simulcast', False)
+            self.UDP_PORT_MAPPING = response.get('udp_ports') or {}
+            self.multiplexed = response.get('multiplexed', False)
+            self.data_addr = response.get('data_addr', self.server_addr)
             self.on_meeting = True
             print(f"Successfully joined conference {self.conference_id}.")
             await self.start_conference()
@@ -202,6 +333,12 @@ class ConferenceClient:
         print(response)
         if response and response.get('status') == 'success':
             print(f"Left the conference {self.conference_id}.")
+            if self.denoiser:
+                print(f"[Info] Noise suppression cost: {self.denoiser.get_stats()}")
+            if self.audio_playout:
+                print(f"[Info] Audio jitter buffers: {self.audio_playout.get_stats()}")
+            if self.tracer and self.tracer.frames:
+                print(self.report_trace())
             self.conference_id = None
             self.on_meeting = False
             self.is_creator = False
@@ -244,19 +381,51 @@ class ConferenceClient:
             captured_data = await capture_function(data_type)
             if captured_data:
                 # print(f"k_sh {captured_data}")OK
-                if compress:  # only image data need to be compressed
-                    captured_data = compress_image(captured_data)
-                if isinstance(captured_data, bytes):
-                    captured_data = base64.b64encode(captured_data).decode() # bytes -> b64byte -> str
-                message = {
-                    'action': 'share',
-                    'data_type': data_type,
-                    'data': captured_data,
-                    'compress': compress,
-                    'fps_or_frequency': fps_or_frequency
-                } # message类型永远是字典
-                await self.send_request(message, send_conn)
-            await asyncio.sleep(1 / fps_or_frequency)  # Control frequency
+                if data_type == 'video' and self.video_mode == 'relay':  # 本地预览自己的摄像头
+                    self.display_image(await self.update_relay_frame(data_type, 'local', captured_data))
+                if data_type == 'audio' and DENOISE_AT == 'sender':
+                    captured_data = self.denoiser.process(np.frombuffer(captured_data, dtype=np.int16)).tobytes()
+                flags = 0
+                layers = None  # [(flags, payload)] when one capture is sent as several frames
+                encode_start = time.time()
+                if data_type == 'video' and self.simulcast:  # 同一采集帧编码出所有层, 服务器为每个接收者挑选一层
+                    controller = self.rate_controllers[data_type]
+                    layers = await get_codec_executor().run(compress_layers, captured_data, SIMULCAST_LAYERS,
+                                                            controller.scale, controller.quality)
+                elif data_type == 'screen':  # 只发送变化的图块
+                    controller = self.rate_controllers[data_type]
+                    self.screen_encoder.quality = controller.quality
+                    encoded = await get_codec_executor().run(self.screen_encoder.encode, captured_data,
+                                                             controller.scale, stateful=True)
+                    if encoded is None:
+                        continue
+                    flags, captured_data = encoded
+                elif data_type == 'video' and self.video_encoder:  # 帧间编码
+                    controller = self.rate_controllers[data_type]
+                    self.video_encoder.set_quality(controller.quality)
+                    encoded = await get_codec_executor().run(self.video_encoder.encode, captured_data,
+                                                             controller.scale, stateful=True)
+                    if encoded is None:
+                        continue
+                    flags, captured_data = encoded
+                elif compress:  # only image data need to be compressed
+                    controller = self.rate_controllers[data_type]
+                    captured_data = await get_codec_executor().run(compress_scaled_image, captured_data,
+                                                                   controller.scale, controller.quality)
+                if layers is None:
+                    layers = [(flags, captured_data)]
+                if data_type == 'video' and self.tracer:  # 追踪: 采集/编码耗时, 上行由接收方结束
+                    now = time.time()
+                    spans = [('capture', *self.capture_stamps['video']), ('encode', encode_start, now),
+                             ('uplink', now, 0)]
+                    layers = [(flags | FLAG_TRACE, pack_trace(spans, payload)) for flags, payload in layers]
+                seq = self.next_seq(data_type)  # simulcast 的各层来自同一采集帧, 共用一个序号
+                for flags, payload in layers:
+                    drain_time = await self.send_frame(data_type, payload, send_conn, flags, seq)
+                if data_type in self.rate_controllers and drain_time is not None:
+                    self.adapt_rate(data_type, drain_time, send_conn)
+            else:  # 未在分享; 分享时由采集线程控制频率
+                await asyncio.sleep(1 / fps_or_frequency)
         # except Exception as e:
         #     print(f"[Error] Failed to share {data_type} data: {e}")
 
@@ -266,21 +435,37 @@ class ConferenceClient:
         """
         if self.share_data[data_type]: # -> close
             self.share_data[data_type] = None
-            print(f"Closed to share {data_type}.")
+            print(f"Closed to share {data_type}. Capture: {self.stop_capture(data_type)}")
         else: # -> open
-            reader, writer = self.data_connections.get(data_type)
-             # open connection for this data_type
+            reader, writer = self.data_connections.get(data_type, (None, None))
             if reader and writer:
-                # Start sharing
+                # start_conference 已为每种数据启动了 keep_share, 这里只打开开关, 避免两个任务共用同一个编码器
                 self.share_data[data_type] = writer
-                asyncio.create_task(self.keep_share(
-                    data_type,
-                    writer,
-                    self.capture_data,
-                    data_type in ('video', 'screen'),
-                    fps_or_frequency = 10
-                ))
-            print(f"Switched to share {data_type}.")
+                self.start_capture(data_type)
+                print(f"Switched to share {data_type}.")
+            else:
+                print(f"[Error]: No data connection available for {data_type}.")
+
+    def force_keyframe(self, data_type):
+        """
+        The server lost part of our screen/camera stream for some receiver: make the next frame a keyframe.
+        """
+        encoder = {'screen': self.screen_encoder, 'video': self.video_encoder}.get(data_type)
+        if encoder:
+            encoder.force_keyframe()
+
+    def request_keyframe(self, sender):
+        """
+        A relayed camera stream lost a packet (or we joined between keyframes): ask the server to have
+        that sender send a keyframe, at most once per KEYFRAME_REQUEST_INTERVAL.
+        """
+        now = time.time()
+        if now - self.keyframe_requests.get(sender, 0) < KEYFRAME_REQUEST_INTERVAL:
+            return
+        self.keyframe_requests[sender] = now
+        reader, writer = self.data_connections.get('video', (None, None))
+        if writer:
+            write_frame(writer, FRAME_KEYFRAME_REQUEST, b'', sender=sender)
 
     async def keep_recv(self, recv_conn, data_type, decompress=None):
         """
@@ -288,10 +473,15 @@ class ConferenceClient:
         """
         try:
             while self.on_meeting:
-                response = await self.read_response(recv_conn)# response 是一个词典
+                if data_type == 'text':
+                    response = await self.read_response(recv_conn)# response 是一个词典
+                else:
+                    response = await self.read_media_response(recv_conn)
                 if response:
                     # print(f"Raw data: {response}")  # 打印原始数据
-                    if response.get('data_type') == data_type:
+                    if response.get('frame_type') == FRAME_KEYFRAME_REQUEST:
+                        self.force_keyframe(data_type)
+                    elif response.get('data_type') == data_type:
                         await self.output_data(response, decompress)
                 else:
                     print("[test]No data listen")
@@ -308,24 +498,46 @@ class ConferenceClient:
         """
         # print(f"out_d {response}")
         data_type = response.get('data_type')
-        data = response.get('data') # str
-        if data_type in ('audio', 'video', 'screen'):
-            data = base64.b64decode(data.encode()) # str -> b64 -> bytes
-        if decompress:
-            data = decompress_image(data)
+        data = response.get('data') # str (text) or bytes (media frame payload)
+        spans = None
+        if response.get('flags', 0) & FLAG_TRACE:
+            spans, data = unpack_trace(data)
+            close_span(spans, response['received'])  # downlink
+            decode_start = time.time()
+        if data_type == 'screen' and data:  # 关键帧或增量图块, 打到该发送者的画布上
+            canvas = self.screen_canvases.setdefault(response.get('client_id'), ScreenCanvas())
+            data = await get_codec_executor().run(canvas.apply, response.get('flags', 0), data, stateful=True)
+            if data is None:
+                return
+        elif data_type == 'video' and data and response.get('flags', 0) & FLAG_CODEC_MASK:
+            sender = response.get('client_id')
+            decoder = self.video_decoders.get(sender)
+            if decoder is None:
+                decoder = self.video_decoders[sender] = VideoDecoder(video_codec_from_flags(response['flags']))
+            data = await get_codec_executor().run(decoder.decode, data, response['flags'], response.get('seq'),
+                                                  stateful=True)
+            if data is None:
+                if decoder.waiting_keyframe:
+                    self.request_keyframe(sender)
+                return
+        elif decompress and data:
+            data = await get_codec_executor().run(decompress_image, data)
+        if spans is not None:
+            render_start = time.time()
+            spans.append(('decode', decode_start, render_start))
 
         if data_type == 'audio':
-            # streamout.write(voice)
-            await self.audio_buffer.put(data)
-
-        elif data_type == 'video':
-            image_cv = cv2.cvtColor(np.array(data), cv2.COLOR_RGB2BGR)
-            # 使用OpenCV展示图像
-            cv2.imshow('Conference', image_cv)
-            cv2.waitKey(10)
-
-        elif data_type == 'screen':
-            pass
+            if self.audio_playout:
+                self.audio_playout.put(response.get('client_id'), response.get('seq'), response.get('timestamp'), data)
+
+        elif data_type in ('video', 'screen'):
+            if self.video_mode == 'relay':
+                data = await self.update_relay_frame(data_type, response.get('client_id'), data)
+            if data is not None:
+                self.display_image(data)
+                if spans is not None and self.tracer:
+                    spans.append(('render', render_start, time.time()))
+                    self.tracer.record(spans, response.get('client_id'), response.get('seq'))
 
         elif data_type == 'text':
             times = response.get('time')
@@ -334,19 +546,59 @@ class ConferenceClient:
         else:
             print(f"Unhandled data type: {data_type}")
 
-    async def play_audio(self):
-        buffer = asyncio.Queue(maxsize=10)
-        self.audio_buffer = buffer
-        while True:
-            if not buffer.empty():
-                data = await buffer.get()
-                audio_block = np.frombuffer(data, dtype=np.int16)
-                voice = nr.reduce_noise(audio_block, RATE)
-                voice = voice.astype(np.int16).tobytes()
+    def display_image(self, image):
+        """
+        Show a PIL image in the OpenCV window.
+        """
+        image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        # 使用OpenCV展示图像
+        cv2.imshow('Conference', image_cv)
+        cv2.waitKey(10)
 
-                streamout.write(voice)
-            else:
-                await asyncio.sleep(0)
+    def report_trace(self):
+        """
+        Write the traced camera frames to TRACE_FILE (Chrome trace JSON).
+
+        :return: str, per-stage latency breakdown, or None if no frame was traced
+        """
+        if not self.tracer or not self.tracer.frames:
+            return None
+        path = self.tracer.dump_chrome_trace(TRACE_FILE)
+        return f"[Info] Frame latency of {self.tracer.frames} frames: {self.tracer.format_breakdown()}, trace: {path}"
+
+    async def update_relay_frame(self, data_type, sender, image):
+        """
+        Relay mode: replace one participant's camera (or the shared screen) and composite locally.
+
+        :param sender: sender id from the frame header ('local' for our own camera preview)
+        :param image: PIL.Image, or b'' when the participant stopped publishing
+        :return: PIL.Image, the composite to display
+        """
+        if not isinstance(image, Image.Image):
+            image = None
+        if data_type == 'screen':
+            self.relay_screen = image
+        elif image is not None:
+            self.relay_cameras[sender] = image
+        else:
+            self.relay_cameras.pop(sender, None)
+        if self.relay_background is None:
+            self.relay_background = Image.open('black.jpg')
+        screen = self.relay_screen if self.relay_screen is not None else self.relay_background
+        return await get_codec_executor().run(overlay_camera_images, screen, list(self.relay_cameras.values()) or None,
+                                              get_screen_size(), (camera_width, camera_height))
+
+    async def play_audio(self):
+        """
+        Run the audio playout thread for as long as this task lives.
+        """
+        process = self.denoiser.process if DENOISE_AT == 'receiver' else None
+        self.audio_playout = AudioPlayout(get_output_stream(), process=process)
+        self.audio_playout.start()
+        try:
+            await asyncio.get_running_loop().create_future()  # 直到任务被取消
+        finally:
+            self.audio_playout.stop()
 
     async def start_conference(self):
         """
@@ -363,6 +615,8 @@ class ConferenceClient:
         # Open separate data connections
         for data_type in self.support_data_types:
             await self.open_data_connection(data_type)
+        if 'video' in self.data_connections:
+            await self.send_viewport()
 
         asyncio.create_task(self.play_audio())
         # asyncio.create_task(self.play_video())
@@ -374,7 +628,7 @@ class ConferenceClient:
                 asyncio.create_task(self.keep_recv(
                     reader,
                     data_type,
-                    data_type == 'video'))
+                    data_type in ('video', 'screen')))
                 await asyncio.sleep(0)
 
         # Start sharing
@@ -396,17 +650,57 @@ class ConferenceClient:
 
     async def capture_data(self, data_type):
         """
-        Simulate the process of capturing data (audio, video, etc.).
-        Replace this with actual data capture logic.
+        Take the next captured value (audio block or PIL image) from the capture thread.
         """
         if not self.share_data[data_type]:
             return None
-        if data_type == 'audio':
-            return capture_voice()
-        elif data_type == 'video':
-            return capture_camera()
-        elif data_type == 'screen':
-            return capture_screen()
+        source = self.capture_sources.get(data_type)
+        stamped = await source.get_stamped() if source else None
+        if stamped is None:
+            return None
+        value, started, captured = stamped
+        self.capture_stamps[data_type] = (started, captured)
+        return value
+
+    def start_capture(self, data_type):
+        """
+        Start the capture thread of a data type; capture_data reads from it.
+        """
+        capture_function = {'audio': capture_voice, 'video': capture_camera, 'screen': capture_screen}[data_type]
+        source = CaptureSource(data_type, capture_function, CAPTURE_FPS[data_type], CAPTURE_DEPTH[data_type])
+        source.start()
+        self.capture_sources[data_type] = source
+        if data_type == 'screen':
+            self.screen_encoder = ScreenDeltaEncoder()  # 每次开始分享都从关键帧开始
+        if data_type == 'video' and self.video_codec != 'jpeg':
+            self.video_encoder = VideoEncoder(self.video_codec, fps=CAPTURE_FPS['video'])
+        if data_type in ('video', 'screen'):
+            quality = CAMERA_QUALITY if data_type == 'video' else SCREEN_QUALITY
+            self.rate_controllers[data_type] = RateController(data_type, quality=quality, fps=CAPTURE_FPS[data_type])
+
+    def adapt_rate(self, data_type, drain_time, writer):
+        """
+        Feed the rate controller of a data type and apply its frame rate to the capture thread.
+        """
+        controller = self.rate_controllers[data_type]
+        loss = writer.pop_loss() if isinstance(writer, DatagramWriter) else None
+        decision = controller.on_sent(drain_time, writer.transport.get_write_buffer_size(), loss)
+        if decision:
+            print(decision)
+        source = self.capture_sources.get(data_type)
+        if source:
+            source.fps = controller.fps
+
+    def stop_capture(self, data_type):
+        """
+        Stop the capture thread of a data type.
+
+        :return: dict, capture timing stats of the stopped source, or None
+        """
+        source = self.capture_sources.pop(data_type, None)
+        if source:
+            source.stop()
+            return source.get_stats()
 
     async def start(self):
         """
@@ -437,6 +731,8 @@ class ConferenceClient:
                             await self.quit_conference()
                         elif cmd == 'cancel':
                             await self.cancel_conference()
+                        elif cmd == 'trace':
+                            print(self.report_trace() or '[Warn]: No traced frames, set TRACE_FRAMES = True.')
                         else:
                             recognized = False
                     elif len(fields) == 2:
@@ -2,41 +2,230 @@
 # python conf_serverTCP.py
 import asyncio
 import json
+import multiprocessing
+import os
+import signal
 import traceback
+from collections import deque
 
-from util import *
+from core import *
 
 # Define supported data types
 DATA_TYPES = ['text', 'audio', 'video', 'screen']
+# actions the control plane forwards to the worker hosting the conference
+WORKER_ACTIONS = ('create', 'join', 'quickJoin', 'quit', 'cancel', 'stats')
+
+
+class Subscriber:
+    def __init__(self, client_id, writer, data_type, on_resync=None):
+        """
+        Outbound side of one media connection: a bounded queue drained by its own writer task.
+        When the queue is full the oldest frame is dropped, so a receiver on a bad link loses
+        frames instead of growing server memory or stalling the broadcaster. Dropping is keyframe-aware:
+        once a frame of a sender's keyframe/delta chain is lost, that sender's deltas are dropped
+        until its next keyframe, since the receiver could only decode them into a corrupt picture.
+
+        :param client_id: client id of the connection
+        :param writer: asyncio.StreamWriter of the connection
+        :param data_type: 'audio', 'video' or 'screen', selects the queue depth
+        :param on_resync: called with (sender, data_type) when a chain breaks, to ask the publisher for a keyframe
+        """
+        self.client_id = client_id
+        self.writer = writer
+        self.data_type = data_type
+        self.on_resync = on_resync
+        self.queue = deque(maxlen=SEND_QUEUE_DEPTH[data_type])
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.broken = set()  # (sender, simulcast layer) whose chain lost a frame, deltas dropped until a keyframe
+        self.closed = False
+        self.task = asyncio.create_task(self.run())
+
+    def put(self, frame):
+        """
+        Queue a packed frame without blocking; drops the oldest queued frame if full.
+        A delta never evicts a queued frame of its own chain (the keyframe or delta it applies on),
+        since that would lose both: it evicts another sender's frame, or is dropped itself.
+        """
+        _, flags, sender, _, _, _ = FRAME_HEADER.unpack_from(frame)
+        chain = (sender, frame_layer(flags))
+        delta = is_delta_frame(flags)
+        if chain in self.broken:
+            if delta:
+                self.count_dropped()
+                return
+            self.broken.discard(chain)  # 关键帧到达, 恢复转发
+        if is_chain_frame(flags) and not delta:
+            self.drop_chain(chain)  # 新关键帧取代这条链中还在排队的帧
+        if len(self.queue) == self.queue.maxlen:
+            victim = next((index for index, queued in enumerate(self.queue)
+                           if not delta or self.get_chain(queued) != chain), None)
+            if victim is None:  # 队列里全是这条链的帧, 丢掉新来的差分帧
+                self.count_dropped()
+                self.break_chain(chain)
+                return
+            self.drop_at(victim)
+        self.queue.append(frame)
+        self.ready.set()
+
+    @staticmethod
+    def get_chain(frame):
+        """
+        :return: (sender, simulcast layer) of a packed frame
+        """
+        _, flags, sender, _, _, _ = FRAME_HEADER.unpack_from(frame)
+        return sender, frame_layer(flags)
+
+    def drop_chain(self, chain):
+        """
+        Drop every queued frame of a chain; a newer keyframe of that chain is about to be queued.
+        """
+        kept = deque((queued for queued in self.queue if self.get_chain(queued) != chain), maxlen=self.queue.maxlen)
+        for _ in range(len(self.queue) - len(kept)):
+            self.count_dropped()
+        self.queue = kept
+
+    def drop_at(self, index):
+        """
+        Drop one queued frame. If it belonged to a keyframe/delta chain, also drop the deltas of that chain
+        still queued behind it, and mark the chain broken unless a keyframe of it is queued.
+        """
+        frame = self.queue[index]
+        del self.queue[index]
+        self.count_dropped()
+        _, flags, _, _, _, _ = FRAME_HEADER.unpack_from(frame)
+        if not is_chain_frame(flags):
+            return
+        chain = self.get_chain(frame)
+        broken = True
+        kept = deque(maxlen=self.queue.maxlen)
+        for position, queued in enumerate(self.queue):
+            if broken and position >= index and self.get_chain(queued) == chain:
+                if is_delta_frame(FRAME_HEADER.unpack_from(queued)[1]):
+                    self.count_dropped()
+                    continue
+                broken = False
+            kept.append(queued)
+        self.queue = kept
+        if broken:
+            self.break_chain(chain)
+
+    def break_chain(self, chain):
+        """
+        Drop the chain's deltas until its next keyframe and ask its publisher for one.
+        """
+        self.broken.add(chain)
+        if self.on_resync:
+            self.on_resync(chain[0], self.data_type)
+
+    def count_dropped(self):
+        self.dropped += 1
+        FRAMES_DROPPED.inc(self.data_type)
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue:
+                    frame = self.queue.popleft()
+                    self.writer.write(frame)
+                    await self.writer.drain()
+                    self.sent += 1
+                    FRAMES_OUT.inc(self.data_type)
+                    BYTES_OUT.inc(self.data_type, amount=len(frame))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[Error] Failed to send {self.data_type} to {self.client_id}: {e}")
+        finally:
+            self.closed = True
+
+    def send_control(self, frame):
+        """
+        Write a small control frame right away, ahead of the queued media; it is never dropped.
+        """
+        if not self.closed:
+            self.writer.write(frame)
+
+    def close(self):
+        self.task.cancel()
+
+    def get_stats(self):
+        return {
+            'depth': len(self.queue),
+            'max_depth': self.queue.maxlen,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'broken_chains': len(self.broken),
+        }
 
 
 class ConferenceServer:
-    def __init__(self, conference_id, data_ports):
+    def __init__(self, conference_id, data_ports, video_mode=VIDEO_MODE, video_codec='jpeg', multiplexed=False,
+                 canvas_size=CANVAS_SIZE):
         """
         Initialize a ConferenceServer with a conference ID and data_type ports.
 
         :param conference_id: Unique identifier for the conference
         :param data_ports: Dictionary mapping data types to their allocated ports
+        :param video_mode: 'compose' (server composites) or 'relay' (server forwards frames untouched)
+        :param video_codec: camera codec negotiated for this conference ('jpeg', 'vp8', 'h264')
+        :param multiplexed: clients reach this conference through MainServer's shared data port,
+                            so no listeners of its own are started
+        :param canvas_size: (width, height) of the composite in compose mode, sent at smaller CANVAS_TIERS too
         """
         self.conference_id = conference_id
         self.data_ports = data_ports  # {'text': port1, 'audio': port2, ...}
+        self.multiplexed = multiplexed
+        self.video_mode = video_mode
+        self.video_codec = video_codec
+        self.video_decoders = {}  # client_id: VideoDecoder of each inter-frame camera stream
         self.clients = {data_type: {} for data_type in DATA_TYPES}  # data_type: {client_id: connection}
+        # media data_type: {client_id: Subscriber}, bounded outbound queue of each media connection
+        self.subscribers = {data_type: {} for data_type in DATA_TYPES if data_type != 'text'}
         self.running = True
         # self.audio_buffers = {}  # 存储每个会议的音频缓冲区
         # self.audio_buffer_timers = {}  # 存储每个会议的计时器
 
-        self.camera_buffer = {}
+        self.camera_buffer = {}  # client_id: newest (PIL, trace spans, enqueue time) not yet composed
+        self.sender_ids = {}  # client_id: sender id carried in media frame headers
+        self.keyframe_requests = {}  # publisher client_id: time of the last FRAME_KEYFRAME_REQUEST sent to it
+        self.video_seq = 0
+        self.canvas_tiers = canvas_tiers(canvas_size)  # (width, height) the composite is encoded at, largest first
+        self.video_tiers = {}  # video client_id: tier picked from the viewport it announced
+        self.last_video_frames = {}  # tier: last composite sent, replayed to newly joined video clients
+        self.layer_selectors = {}  # relay mode: video client_id: LayerSelector, simulcast layer it receives
+        self.publisher_layers = {}  # relay mode: video client_id: simulcast layers it publishes, from its video hello
+        self.video_clock = {'fps': COMPOSE_FPS, 'ticks': 0, 'frames': 0, 'missed_deadlines': 0,
+                            'skipped_ticks': 0, 'skipped_camera_frames': 0, 'max_tick_ms': 0.0}
+        self.compositor = Compositor(Image.open('black.jpg'), canvas_size) if video_mode == 'compose' else None
+        self.screen_canvases = {}  # client_id: ScreenCanvas, patched with the tiles each sharer sends
+        self.mixer = AudioMixer() if AUDIO_MIX else None
+        self.denoisers = {} if DENOISE_AT == 'server' else None  # client_id: StreamingDenoiser
+        self.audio_seq = {}  # listener client_id: next seq of its mixed stream
         # Start servers for each data type
-        self.data_servers = {'playVideo': asyncio.create_task(
-            self.playVideo()
-        )}  # + playVideo
+        self.data_servers = {}
+        self.datagram_protocols = {}  # data_type: MediaDatagramProtocol
+        if self.video_mode == 'compose':
+            self.data_servers['playVideo'] = asyncio.create_task(self.playVideo())
+        if self.mixer:
+            self.data_servers['mixAudio'] = asyncio.create_task(self.mixAudio())
         for data_type, port in self.data_ports.items():
+            if self.multiplexed:
+                break
             # Start plain TCP server
             self.data_servers[data_type] = asyncio.create_task(
                 self.start_server(data_type, port)
             )
-
-        self.screen_share = None
+        for data_type in UDP_DATA_TYPES:
+            if self.multiplexed:
+                break
+            # UDP endpoint on the same port number, for clients that negotiated the datagram transport
+            self.data_servers[f'{data_type}_udp'] = asyncio.create_task(
+                self.start_datagram_server(data_type, self.data_ports[data_type])
+            )
 
     async def start_server(self, data_type, port):
         """
@@ -57,6 +246,22 @@ class ConferenceServer:
         async with server:
             await server.serve_forever()
 
+    async def start_datagram_server(self, data_type, port):
+        """
+        Starts the UDP endpoint of a media type; every remote address is served by handle_media_client.
+        """
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: MediaDatagramProtocol(lambda r, w: self.handle_media_client(r, w, data_type)),
+            local_addr=(SERVER_IP, port)
+        )
+        self.datagram_protocols[data_type] = protocol
+        print(f"Datagram server for conference {self.conference_id} started on port {port}.")
+        try:
+            await asyncio.Future()
+        finally:
+            transport.close()
+
     async def handle_text_client(self, reader, writer, data_type):
         """
         Handles incoming text client connections and relays messages.
@@ -69,6 +274,8 @@ class ConferenceServer:
                 data = await reader.readline()
                 if not data:
                     break
+                FRAMES_IN.inc(data_type)
+                BYTES_IN.inc(data_type, amount=len(data))
                 # message = data.decode().strip()
                 message = json.loads(data.decode().strip())
                 content = message.get('data')
@@ -92,105 +299,426 @@ class ConferenceServer:
         client_id = get_client_id(writer)
         # print(f"Text client {client_id} connected to conference {self.conference_id}.")
         self.clients[data_type][client_id] = writer
-        # try:
-        while self.running:
-            # data = await reader.readline()
-            data = b''
-            while True:
-                try:
-                    chunk = await reader.readuntil(separator=b'\n')
-                    data += chunk.strip()
+        self.subscribers[data_type][client_id] = Subscriber(client_id, writer, data_type, self.request_keyframe)
+        if data_type == 'video' and self.compositor:
+            self.replay_video_frame(client_id)
+        if data_type == 'video' and self.video_mode == 'relay':
+            self.layer_selectors[client_id] = LayerSelector(client_id)
+        try:
+            while self.running:
+                frame = await read_frame(reader)
+                if frame is None:
                     break
-                except asyncio.exceptions.LimitOverrunError as e:
-                    chunk = await reader.read(e.consumed)
-                    data += chunk
-                except asyncio.exceptions.IncompleteReadError as e2:
-                    await asyncio.sleep(0.1)
-            if len(data) == 0:
-                break
-            message = json.loads(data.decode().strip())
-            content = message.get('data')
-            # now = time.localtime()
-            if data_type == 'audio':
-                await self.share_audio(content, client_id)
-            elif data_type == 'video':
-                await self.handle_video(content, client_id)
-            elif data_type == 'screen':
-                await self.handle_screen(content, client_id)
-            else:
-                print(f'Unknown format: {data_type}')
-        # except Exception as e:
-        #     print(f"[Error] Text client {client_id} error: {e}")
+                header, payload = frame
+                if header.frame_type == FRAME_HELLO:
+                    if data_type == 'video' and payload:
+                        self.video_hello(client_id, payload)
+                    continue
+                if header.frame_type == FRAME_KEYFRAME_REQUEST:  # 接收方的解码器丢了参考帧, 转给发送者
+                    self.request_keyframe(header.sender, data_type)
+                    continue
+                FRAMES_IN.inc(data_type)
+                BYTES_IN.inc(data_type, amount=len(payload))
+                try:
+                    if data_type == 'audio':
+                        await self.share_audio(payload, client_id, header)
+                    elif data_type == 'video':
+                        await self.handle_video(payload, client_id, header)
+                    elif data_type == 'screen':
+                        await self.handle_screen(payload, client_id, header)
+                    else:
+                        print(f'Unknown format: {data_type}')
+                except Exception as e:  # 一帧坏数据 (无法解码的图像等) 不应断开发布者
+                    print(f"[Error] Dropped bad {data_type} frame {header.seq} from {client_id}: {e!r}")
+        finally:  # 无论如何断开, 都要清理这个连接的状态
+            self.clients[data_type].pop(client_id, None)
+            subscriber = self.subscribers[data_type].pop(client_id, None)
+            if subscriber:
+                subscriber.close()
+            if data_type == 'video':
+                self.video_tiers.pop(client_id, None)
+                self.layer_selectors.pop(client_id, None)
+            await self.drop_publisher(client_id, data_type)
 
-    async def share_audio(self, content, client_id):
-        response = {
-            'data_type': 'audio',
-            'client_id': client_id,
-            'data': content,
-        }
-        await self.broadcast(json.dumps(response), client_id, 'audio')
+    def video_hello(self, client_id, payload):
+        """
+        FRAME_HELLO a client sends on its video connection before any frame: {'viewport': [w, h]}, and
+        {'simulcast': true} if its create/join response granted simulcast. The number of layers a publisher
+        sends is fixed here, so its first frames already go only to the receivers of their layer.
+        """
+        try:
+            message = json.loads(payload.decode())
+        except (ValueError, UnicodeDecodeError):
+            return
+        if not isinstance(message, dict):
+            return
+        if negotiate_simulcast(message, self.video_mode, self.video_codec):
+            self.publisher_layers[client_id] = len(SIMULCAST_LAYERS)
+        if 'viewport' in message:  # 其他 hello (例如 UDP 握手) 不带 viewport
+            self.set_viewport(client_id, message['viewport'])
+
+    def set_viewport(self, client_id, viewport):
+        """
+        A video client announced the size it displays the composite at;
+        switch it to the matching canvas tier, or in relay mode cap the simulcast layer it receives.
 
-    async def handle_video(self, content, client_id):
-        if client_id not in self.camera_buffer:
-            self.camera_buffer[client_id] = asyncio.Queue(maxsize=10)
-        con_bytes = base64.b64decode(content.encode())  # str -> b64 -> bytes
-        camera = decompress_image(con_bytes)  # bytes -> PIL
-        await self.camera_buffer[client_id].put(camera)
+        :param viewport: [width, height] from its video hello
+        """
+        try:
+            viewport = (max(int(viewport[0]), 1), max(int(viewport[1]), 1))
+        except (ValueError, TypeError, IndexError):
+            return
+        if not self.compositor:
+            if client_id in self.layer_selectors:
+                self.layer_selectors[client_id].set_viewport(viewport)
+            return
+        tier = pick_canvas_tier(self.canvas_tiers, viewport)
+        if self.video_tiers.get(client_id, self.canvas_tiers[0]) != tier:
+            self.video_tiers[client_id] = tier
+            self.replay_video_frame(client_id)
+
+    def replay_video_frame(self, client_id):
+        """
+        Give a video client the last composite of its tier, or have the next tick redraw one
+        if nobody was receiving that tier.
+        """
+        frame = self.last_video_frames.get(self.video_tiers.get(client_id, self.canvas_tiers[0]))
+        subscriber = self.subscribers['video'].get(client_id)
+        if frame and subscriber:
+            subscriber.put(frame)
+        else:
+            self.compositor.invalidate()
+
+    def get_subscribed_tiers(self):
+        """
+        :return: {tier: [video client_id]}, only the tiers someone receives
+        """
+        tiers = {}
+        for client_id in self.subscribers['video']:
+            tiers.setdefault(self.video_tiers.get(client_id, self.canvas_tiers[0]), []).append(client_id)
+        return tiers
+
+    def get_sender_id(self, client_id):
+        """
+        Map a client connection to the small integer id used in media frame headers (0 is the server).
+        """
+        if client_id not in self.sender_ids:
+            self.sender_ids[client_id] = len(self.sender_ids) + 1
+        return self.sender_ids[client_id]
+
+    def request_keyframe(self, sender, data_type):
+        """
+        A receiver (a Subscriber queue, a client's decoder, or our own compose-mode decoder) lost part of
+        a publisher's keyframe/delta chain: send the publisher a FRAME_KEYFRAME_REQUEST
+        on its own connection, at most once per KEYFRAME_REQUEST_INTERVAL, instead of leaving receivers
+        without a picture until its next periodic keyframe.
+
+        :param sender: sender id carried in the frame headers of the publisher
+        """
+        client_id = next((client_id for client_id, sender_id in self.sender_ids.items() if sender_id == sender), None)
+        subscriber = self.subscribers[data_type].get(client_id)
+        now = time.time()
+        if subscriber is None or now - self.keyframe_requests.get(client_id, 0) < KEYFRAME_REQUEST_INTERVAL:
+            return
+        self.keyframe_requests[client_id] = now
+        subscriber.send_control(pack_frame(FRAME_KEYFRAME_REQUEST, b''))
+
+    async def share_audio(self, content, client_id, header):
+        if self.denoisers is not None:
+            denoiser = self.denoisers.setdefault(client_id, StreamingDenoiser())
+            content = denoiser.process(np.frombuffer(content, dtype=np.int16)).tobytes()
+        if self.mixer:
+            self.mixer.push(client_id, header.seq, header.timestamp, content)
+            return
+        frame = pack_frame(FRAME_AUDIO, content,
+                           sender=self.get_sender_id(client_id),
+                           seq=header.seq,
+                           timestamp=header.timestamp)
+        await self.broadcast(frame, client_id, 'audio')
+
+    async def relay_frame(self, frame_type, content, client_id, header):
+        """
+        Forward a compressed frame untouched to the other participants, tagged with the sender id.
+        """
+        frame = pack_frame(frame_type, content,
+                           sender=self.get_sender_id(client_id),
+                           seq=header.seq,
+                           timestamp=header.timestamp,
+                           flags=header.flags)
+        targets = None
+        if frame_type == FRAME_VIDEO and self.publisher_layers.get(client_id, 1) > 1:
+            targets = self.layer_receivers(client_id, frame_layer(header.flags))
+        await self.broadcast(frame, client_id, FRAME_DATA_TYPES[frame_type], targets=targets)
+
+    def layer_receivers(self, client_id, layer):
+        """
+        Simulcast: the receivers that get this layer of a publisher's camera, i.e. whose selected layer
+        (capped to the layers the publisher sends) is this one. Each of them counts as sent a frame.
 
-    async def handle_screen(self, content, client_id):
-        con_bytes = base64.b64decode(content.encode())
-        screen_frame = decompress_image(con_bytes)
-        self.screen_share = screen_frame
+        :return: list of video client_id
+        """
+        top = self.publisher_layers[client_id] - 1
+        receivers = []
+        for receiver, selector in list(self.layer_selectors.items()):
+            if receiver == client_id or min(selector.layer, top) != layer:
+                continue
+            subscriber = self.subscribers['video'].get(receiver)
+            direction = selector.on_frame(subscriber.dropped if subscriber else 0)
+            if direction:  # 只计数, 每次切换都打印会在码率震荡时刷屏; 明细见 get_stats
+                LAYER_SWITCHES.inc(direction)
+            receivers.append(receiver)
+        return receivers
+
+    async def drop_publisher(self, client_id, data_type):
+        """
+        Forget a camera/screen publisher; in relay mode an empty frame tells clients to remove its tile.
+        """
+        if data_type == 'audio' and self.mixer:
+            self.mixer.remove_source(client_id)
+            self.audio_seq.pop(client_id, None)
+        if data_type == 'audio' and self.denoisers:
+            self.denoisers.pop(client_id, None)
+        self.keyframe_requests.pop(client_id, None)
+        if data_type == 'screen':
+            self.screen_canvases.pop(client_id, None)
+        if data_type == 'video':
+            self.camera_buffer.pop(client_id, None)
+            self.video_decoders.pop(client_id, None)
+            self.publisher_layers.pop(client_id, None)
+            if self.compositor:
+                self.compositor.remove_camera(client_id)
+        if self.video_mode == 'relay' and data_type in ('video', 'screen') and client_id in self.sender_ids:
+            await self.broadcast(pack_frame(FRAME_TYPES[data_type], b'', sender=self.sender_ids[client_id]),
+                                 client_id, data_type)
+
+    async def handle_video(self, content, client_id, header):
+        spans = None
+        if header.flags & FLAG_TRACE:
+            received = time.time()
+            spans, content = unpack_trace(content)
+            close_span(spans, received)  # uplink
+        if self.video_mode == 'relay':
+            if spans is not None:
+                spans.append(('downlink', time.time(), 0))
+                content = pack_trace(spans, content)
+            await self.relay_frame(FRAME_VIDEO, content, client_id, header)
+            return
+        if header.flags & FLAG_CODEC_MASK:  # 帧间编码, 每个发送者一个解码器
+            decoder = self.video_decoders.get(client_id)
+            if decoder is None:
+                decoder = self.video_decoders[client_id] = VideoDecoder(video_codec_from_flags(header.flags))
+            camera = await get_codec_executor().run(decoder.decode, content, header.flags, header.seq, stateful=True)
+            if camera is None:
+                if decoder.waiting_keyframe:
+                    self.request_keyframe(self.get_sender_id(client_id), 'video')
+                return
+        else:
+            camera = await get_codec_executor().run(decompress_image, content)  # bytes -> PIL
+        if spans is not None:
+            spans.append(('server_decode', received, time.time()))
+        if client_id in self.camera_buffer:  # 上一帧还没被合成, 只保留最新的一帧
+            self.video_clock['skipped_camera_frames'] += 1
+            CAMERA_FRAMES_SKIPPED.inc()
+        self.camera_buffer[client_id] = (camera, spans, time.time())
+
+    async def handle_screen(self, content, client_id, header):
+        if self.video_mode == 'relay':
+            await self.relay_frame(FRAME_SCREEN, content, client_id, header)
+            return
+        canvas = self.screen_canvases.setdefault(client_id, ScreenCanvas())
+        screen_frame = await get_codec_executor().run(canvas.apply, header.flags, content, stateful=True)
+        if screen_frame is not None:
+            self.compositor.set_screen(screen_frame)
 
     async def playVideo(self):  # in asyncio.create_task
+        """
+        Every 1 / COMPOSE_FPS seconds, compose the newest frame of every camera and broadcast the composite.
+        Sleeps until the next deadline, so compose/encode time does not lower the frame rate.
+        """
+        codec = get_codec_executor()
+        loop = asyncio.get_running_loop()
+        period = 1 / COMPOSE_FPS
+        next_tick = loop.time()
         while True:
-            camera_images = []
-            for client, buffer in self.camera_buffer.items():  # PIL
-                if not buffer.empty():
-                    frame = await buffer.get()
-                    camera_images.append(frame)
-            if len(camera_images) == 0:
-                camera_images = None
-            screen = Image.open('black.jpg')
-            if self.screen_share:
-                screen = self.screen_share
-            frame = overlay_camera_images(screen, camera_images)
-            # print(camera_images)
-            data = compress_image(frame, quality=60)
-            content = base64.b64encode(data).decode()
-            message = {
-                'data_type': 'video',
-                'client_id': None,
-                'data': content,
-            }
-            # Broadcast the message to all other text clients
-            await self.broadcast(json.dumps(message),
-                                 None,
-                                 'video',
-                                 forself=True)
-            await asyncio.sleep(0.05) #让出控制权
+            tick_start = loop.time()
+            spans = None  # trace of the newest traced camera frame in this composite
+            for client_id in list(self.camera_buffer):
+                camera, camera_spans, enqueued = self.camera_buffer.pop(client_id)
+                self.compositor.set_camera(client_id, camera)
+                if camera_spans is not None:
+                    spans = camera_spans + [('server_queue', enqueued, time.time())]
+            # None: nothing changed, skip encoding and broadcasting
+            start = time.perf_counter()
+            compose_start = time.time()
+            frame = await codec.run(self.compositor.compose, stateful=True)
+            if frame is not None:
+                encode_start = time.perf_counter()
+                COMPOSE_SECONDS.observe(encode_start - start)
+                encode_wall = time.time()
+                # 每个有人订阅的分辨率档位只编码一次, 由该档位的所有接收者共享
+                tiers = self.get_subscribed_tiers()
+                encoded = await asyncio.gather(*(codec.run(compress_fitted_image, frame, tier, 60)
+                                                 for tier in tiers))
+                ENCODE_SECONDS.observe(time.perf_counter() - encode_start)
+                flags = 0
+                if spans is not None:
+                    now = time.time()
+                    spans += [('compose', compose_start, encode_wall), ('server_encode', encode_wall, now),
+                              ('downlink', now, 0)]
+                    flags = FLAG_TRACE
+                self.last_video_frames = {}  # 没人订阅的档位不再有最新画面
+                for (tier, client_ids), data in zip(tiers.items(), encoded):
+                    if spans is not None:
+                        data = pack_trace(spans, data)
+                    self.last_video_frames[tier] = pack_frame(FRAME_VIDEO, data, seq=self.video_seq, flags=flags)
+                    await self.broadcast(self.last_video_frames[tier], None, 'video', forself=True,
+                                         targets=client_ids)
+                self.video_seq += 1
+                self.video_clock['frames'] += 1
+            self.video_clock['ticks'] += 1
+            self.video_clock['max_tick_ms'] = max(self.video_clock['max_tick_ms'],
+                                                  round((loop.time() - tick_start) * 1000, 2))
+            next_tick += period
+            delay = next_tick - loop.time()
+            if delay < 0:
+                self.video_clock['missed_deadlines'] += 1
+                DEADLINES_MISSED.inc()
+                if delay < -period:  # 落后超过一帧: 跳过错过的节拍, 不补发
+                    skipped = int(-delay / period)
+                    self.video_clock['skipped_ticks'] += skipped
+                    next_tick += skipped * period
+                    delay = next_tick - loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+    async def mixAudio(self):  # in asyncio.create_task
+        """
+        Every CHUNK / RATE seconds, mix one block of every speaker and queue each listener's N-1 mix.
+        """
+        loop = asyncio.get_running_loop()
+        period = CHUNK / RATE
+        next_tick = loop.time()
+        while True:
+            result = self.mixer.mix(list(self.subscribers['audio']))
+            if result:
+                mixes, timestamp = result
+                for client_id, data in mixes.items():
+                    subscriber = self.subscribers['audio'].get(client_id)
+                    if subscriber is None:
+                        continue
+                    seq = self.audio_seq.get(client_id, 0)
+                    self.audio_seq[client_id] = seq + 1
+                    subscriber.put(pack_frame(FRAME_AUDIO, data, seq=seq, timestamp=timestamp))
+            next_tick += period
+            delay = next_tick - loop.time()
+            if delay < -period:  # 落后太多时重新对齐时钟, 不补发
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(max(delay, 0))
 
-    async def broadcast(self, message, sender_id, data_type, forself=False):
+    async def broadcast(self, message, sender_id, data_type, forself=False, targets=None):
         """
         Broadcasts a message to all connected clients except the sender.
+        The message is encoded once and the same bytes are written to every writer;
+        drains then run concurrently, each bounded by BROADCAST_DRAIN_TIMEOUT.
+        Media frames are not written here but queued on each receiver's Subscriber.
+
+        :param message: str (JSON line on the text port) or bytes (packed media frame)
+        :param targets: client_ids to send to (e.g. the receivers of one canvas tier), all clients if None
         """
+        start = time.perf_counter()
+        try:
+            await self.fan_out(message, sender_id, data_type, forself, targets)
+        finally:
+            BROADCAST_SECONDS.observe(time.perf_counter() - start, str(data_type))
+
+    async def fan_out(self, message, sender_id, data_type, forself, targets=None):
+        if isinstance(message, str):
+            message = f"{message}\n".encode()
+        if str(data_type) in self.subscribers:
+            for client_id, subscriber in list(self.subscribers[str(data_type)].items()):
+                if not forself and client_id and client_id == sender_id:
+                    continue
+                if targets is not None and client_id not in targets:
+                    continue
+                if subscriber.closed:
+                    del self.subscribers[str(data_type)][client_id]
+                    await self.drop_client(client_id, subscriber.writer, data_type)
+                    continue
+                subscriber.put(message)
+            return
+        written = []
         for client_id, writer in list(self.clients[str(data_type)].items()):
             if not forself:
                 if client_id and client_id == sender_id:
                     continue
+            if targets is not None and client_id not in targets:
+                continue
             try:
-                # writer.write(f"{sender_id}: {message}\n".encode())
-                writer.write(f"{message}\n".encode())
-                await writer.drain()
-                # print("send msg to " + client_id)
+                writer.write(message)
+                written.append((client_id, writer))
             except Exception as e:
                 print(f"[Error] Failed to send message to {client_id}: {e}")
-                if client_id in self.clients[str(data_type)]:
-                    del self.clients[str(data_type)][client_id]
-                    writer.close()
-                    await writer.wait_closed()
+                await self.drop_client(client_id, writer, data_type)
+        if written:
+            FRAMES_OUT.inc(str(data_type), amount=len(written))
+            BYTES_OUT.inc(str(data_type), amount=len(message) * len(written))
+            await asyncio.gather(*(self.drain_client(client_id, writer, data_type)
+                                   for client_id, writer in written))
 
-    async def quit_conference(self, client_id, cid_list, main_writer):
+    async def drain_client(self, client_id, writer, data_type):
+        """
+        Wait for one writer to flush. A receiver that is merely slow is left behind for this
+        message instead of holding up the room; a broken connection is dropped.
+        """
+        try:
+            await asyncio.wait_for(writer.drain(), BROADCAST_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass  # 数据仍在该连接的缓冲区中, 不再等待它
+        except Exception as e:
+            print(f"[Error] Failed to send message to {client_id}: {e}")
+            await self.drop_client(client_id, writer, data_type)
+
+    async def drop_client(self, client_id, writer, data_type):
+        if client_id in self.clients[str(data_type)]:
+            del self.clients[str(data_type)][client_id]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    def get_stats(self):
+        """
+        Outbound queue depth and drop counters of every media subscriber, plus audio processing cost
+        and the compose frame clock.
+        """
+        stats = {
+            'subscribers': {data_type: {client_id: subscriber.get_stats()
+                                        for client_id, subscriber in subscribers.items()}
+                            for data_type, subscribers in self.subscribers.items()},
+        }
+        if self.denoisers is not None:
+            stats['denoise'] = {client_id: denoiser.get_stats() for client_id, denoiser in self.denoisers.items()}
+        if self.video_mode == 'compose':
+            stats['video_clock'] = dict(self.video_clock)
+            stats['compositor'] = self.compositor.get_stats()
+            stats['canvas_tiers'] = {f'{width}x{height}': len(client_ids)
+                                     for (width, height), client_ids in self.get_subscribed_tiers().items()}
+        if self.layer_selectors:
+            stats['simulcast'] = {'publishers': dict(self.publisher_layers),
+                                  'receivers': {client_id: selector.get_stats()
+                                                for client_id, selector in self.layer_selectors.items()}}
+        if self.datagram_protocols:
+            stats['datagram'] = {data_type: protocol.get_stats()
+                                 for data_type, protocol in self.datagram_protocols.items()}
+        return stats
+
+    async def quit_conference(self, client_id, cid_list):
+        """
+        Close the media connections of a leaving client.
+
+        :return: response dict for the quitting client
+        """
         try:
             for data_type in DATA_TYPES:
                 if data_type == 'text':
@@ -199,22 +727,21 @@ class ConferenceServer:
                 writer.close()
                 await writer.wait_closed()
                 # del self.clients[data_type][client_id]
-            if cid_list['video'] in self.camera_buffer:
-                del self.camera_buffer[cid_list['video']]
+            await self.drop_publisher(cid_list['video'], 'video')
             print(f'{client_id} exited conference {self.conference_id}')
-            response = {'status': 'success',
-                        'conference_id': self.conference_id,}
-            main_writer.write((json.dumps(response)+'\n').encode())
-            await main_writer.drain()
-
             print('server handle QUIT fin.')
+            return {'status': 'success',
+                    'conference_id': self.conference_id,}
         except Exception as e:
             print(e, f'q_c')
             traceback.print_exc()
+            return {'status': 'error', 'message': str(e)}
 
-    async def cancel_conference(self, main_writer): #还没测过
+    async def cancel_conference(self): #还没测过
         """
         Ends the conference by closing all client connections and stopping servers.
+
+        :return: response dict for the cancelling client
         """
         print(f"Cancelling conference {self.conference_id}...")
         try:
@@ -233,75 +760,149 @@ class ConferenceServer:
 
             #Close all data connections
             for data_type in DATA_TYPES:
-                for client_id, writer in self.clients[data_type].items():
+                for client_id, writer in list(self.clients[data_type].items()):
                     writer.close()
                     await writer.wait_closed()
                 self.clients[data_type].clear()
 
-            response = {'status': 'success',
-                        'conference_id': self.conference_id, }
-            main_writer.write((json.dumps(response)+"\n").encode())
-            await main_writer.drain()
             self.running = False
             print(f"Conference {self.conference_id} has been canceled.")
+            return {'status': 'success',
+                    'conference_id': self.conference_id, }
         except asyncio.CancelledError:
-            pass
+            raise
         except Exception as e:
             print(e)
             traceback.print_exc()
+            return {'status': 'error', 'message': str(e)}
 
 
 class MainServer:
-    def __init__(self, server_ip, main_port):
+    def __init__(self, server_ip, main_port, workers=CONFERENCE_WORKERS):
+        """
+        :param workers: number of ConferenceWorker processes; 0 hosts every conference in this process,
+                        otherwise this server is only the control plane and forwards conference actions
+        """
         self.server_ip = server_ip
         self.server_port = main_port
+        self.data_ip = server_ip
+        self.data_port = DATA_PORT
+        self.multiplexed = MULTIPLEX_DATA_PORT
         self.conference_servers = {}
         self.pool = PortPool(50000, 60000)  # Expanded port range for multiple conferences
         self.audio_buffers = {}
         self.audio_buffer_timers = {}
+        self.workers = [WorkerHandle(i, WORKER_CONTROL_PORT + i, WORKER_DATA_PORT + i, server_ip)
+                        for i in range(workers)]
+        self.conference_workers = {}  # conference_id: WorkerHandle hosting it
+        self.parent_sentinel = None  # ConferenceWorker: pipe fd readable (EOF) once the control plane process exits
+        self.metrics_port = METRICS_PORT
+        self.register_metrics()
+
+    def register_metrics(self):
+        """
+        Gauges of this server, read from its live state only when the metrics endpoint is scraped.
+        """
+        conferences = lambda: list(self.conference_servers.values())
+        METRICS.gauge('conf_active_conferences', 'Conferences hosted here or placed on workers.',
+                      collect=lambda: len(self.conference_servers) + len(self.conference_workers))
+        METRICS.gauge('conf_clients', 'Connected client connections.', ('data_type',),
+                      lambda: {(data_type,): sum(len(c.clients[data_type]) for c in conferences())
+                               for data_type in DATA_TYPES})
+        METRICS.gauge('conf_subscriber_queue_depth', 'Frames waiting in subscriber queues.', ('data_type',),
+                      lambda: {(data_type,): sum(len(subscriber.queue) for c in conferences()
+                                                 for subscriber in c.subscribers[data_type].values())
+                               for data_type in DATA_TYPES if data_type != 'text'})
+        METRICS.gauge('conf_camera_buffer_depth', 'Camera frames waiting to be composed.',
+                      collect=lambda: sum(len(c.camera_buffer) for c in conferences()))
+        METRICS.gauge('conf_port_pool_ports', 'Ports of the conference port pool.', ('state',),
+                      lambda: {(state,): self.pool.get_stats()[state] for state in ('free', 'used', 'quarantined')})
+        METRICS.gauge('conf_port_pool_allocation_seconds', 'Port allocation latency.', ('stat',),
+                      lambda: {(stat,): self.pool.get_stats()[f'{stat}_ms'] / 1000 for stat in ('avg', 'max')})
+        if self.workers:
+            METRICS.gauge('conf_worker_healthy', 'Health of each conference worker.', ('worker',),
+                          lambda: {(worker.worker_id,): int(worker.healthy) for worker in self.workers})
+
+    def new_conference_id(self):
+        """
+        Random conference id not used by this server or any of its workers.
+        """
+        while True:
+            conference_id = int(np.random.randint(10000, 99999))
+            if str(conference_id) not in self.conference_servers and str(conference_id) not in self.conference_workers:
+                return conference_id
 
-    async def create_conference(self, writer):
+    async def create_conference(self, writer, message):
         """
         Create a new conference by allocating ports for each data type and starting a ConferenceServer.
+
+        :param message: the create request; may carry 'video_mode', 'video_codec', 'video_codecs', 'transport',
+                        'canvas_size' and 'simulcast'
         """
-        conference_id = np.random.randint(10000, 99999)
+        video_mode = message.get("video_mode", VIDEO_MODE)
+        if video_mode not in VIDEO_MODES:
+            video_mode = VIDEO_MODE
+        video_codec = negotiate_video_codec(message.get("video_codec", VIDEO_CODEC), message.get("video_codecs"))
+        canvas_size = parse_canvas_size(message.get("canvas_size"))
+        conference_id = message.get("conference_id") or self.new_conference_id()  # 由控制面指定或本地生成
         self.audio_buffers[str(conference_id)] = []
         self.audio_buffer_timers[str(conference_id)] = None
 
-        allocated_ports = self.pool.get_ports(len(DATA_TYPES))
-        if not allocated_ports:
-            raise Exception("没有足够的可用端口分配给所有数据类型。")
-
-        data_ports = dict(zip(DATA_TYPES, allocated_ports))
+        if self.multiplexed:
+            # 所有会议共用一个数据端口, 不需要分配和绑定端口
+            allocated_ports = [self.data_port]
+            data_ports = {data_type: self.data_port for data_type in DATA_TYPES}
+        else:
+            allocated_ports = self.pool.get_ports(len(DATA_TYPES))
+            if not allocated_ports:
+                raise Exception("没有足够的可用端口分配给所有数据类型。")
+            data_ports = dict(zip(DATA_TYPES, allocated_ports))
 
         # Initialize ConferenceServer with allocated ports
-        conference_server = ConferenceServer(conference_id, data_ports)
+        conference_server = ConferenceServer(conference_id, data_ports, video_mode, video_codec,
+                                             multiplexed=self.multiplexed, canvas_size=canvas_size)
         self.conference_servers[str(conference_id)] = conference_server
 
         response = {
             "status": "success",
             "conference_id": str(conference_id),
             "ports": data_ports,  # {'text': port1, 'audio': port2, ...}
-            "client_id": get_client_id(writer)
-
+            "multiplexed": self.multiplexed,
+            "client_id": get_client_id(writer),
+            "video_mode": video_mode,
+            "video_codec": video_codec,
+            "canvas_tiers": conference_server.canvas_tiers,
+            "simulcast": negotiate_simulcast(message, video_mode, video_codec),
+            **negotiate_transport(message, data_ports)
         }
         writer.write((json.dumps(response) + "\n").encode())
         await writer.drain()
         # await conference_server.addClient(get_client_id(writer))
         print(f"Conference {conference_id} created with ports: {allocated_ports}")
 
-    async def join_conference(self, conference_id, writer):
+    async def join_conference(self, conference_id, writer, message=None):
         """
         Add a client to an existing conference by providing the necessary ports.
+
+        :param message: the join request; 'video_codecs' lists the camera codecs the client supports,
+                        'transport' asks for 'udp' audio/video, 'simulcast' offers camera layers
         """
         conference_id_str = str(conference_id)
         if conference_id_str in self.conference_servers:
             conference_server = self.conference_servers[conference_id_str]
+            # 客户端不支持会议的编码时退回 JPEG
+            video_codec = negotiate_video_codec(conference_server.video_codec, (message or {}).get("video_codecs"))
             response = {
                 "status": "success",
                 "conference_id": conference_id_str,
                 "ports": conference_server.data_ports,  # {'text': port1, 'audio': port2, ...}
-                "client_id": get_client_id(writer)
+                "multiplexed": conference_server.multiplexed,
+                "client_id": get_client_id(writer),
+                "video_mode": conference_server.video_mode,
+                "video_codec": video_codec,
+                "canvas_tiers": conference_server.canvas_tiers,
+                "simulcast": negotiate_simulcast(message or {}, conference_server.video_mode, video_codec),
+                **negotiate_transport(message or {}, conference_server.data_ports)
             }
             writer.write((json.dumps(response) + "\n").encode())
             await writer.drain()
@@ -323,8 +924,11 @@ class MainServer:
         if c_id_str in self.conference_servers:
             cid_list = message.get('cids')
             conference_server = self.conference_servers[c_id_str]
-            await conference_server.quit_conference(client_id, cid_list, writer)
-        ######
+            response = await conference_server.quit_conference(client_id, cid_list)
+        else:
+            response = {"status": "error", "message": f"Conference {conference_id} not found."}
+        writer.write((json.dumps(response) + "\n").encode())
+        await writer.drain()
 
     async def cancel_conference_handle(self, conference_id, writer):
         """
@@ -333,15 +937,147 @@ class MainServer:
         conference_id_str = str(conference_id)
         if conference_id_str in self.conference_servers:
             conference_server = self.conference_servers.pop(conference_id_str)
-            await conference_server.cancel_conference(writer)
+            response = await conference_server.cancel_conference()
             # Release allocated ports
-            for port in conference_server.data_ports.values():
-                self.pool.release_ports([port])
+            if not conference_server.multiplexed:
+                for port in conference_server.data_ports.values():
+                    self.pool.release_ports([port])
         else:
             response = {"status": "error", "message": f"Conference {conference_id} not found."}
+            print(f"[Error] Conference {conference_id} not found for cancellation.")
+        writer.write((json.dumps(response) + "\n").encode())
+        await writer.drain()
+
+    def route_data_connection(self, message):
+        """
+        Find the conference a connection on the shared data port belongs to.
+
+        :param message: handshake {'conference_id': ..., 'data_type': ...}
+        :return: (ConferenceServer or None, data_type)
+        """
+        conference_server = self.conference_servers.get(str(message.get('conference_id')))
+        data_type = message.get('data_type')
+        if conference_server is None or data_type not in DATA_TYPES:
+            return None, data_type
+        return conference_server, data_type
+
+    async def data_handler(self, reader, writer):
+        """
+        Route a TCP connection on the shared data port by the handshake line the client sends first,
+        then hand it over to its conference as if it had connected to a per-conference port.
+        """
+        try:
+            message = json.loads((await reader.readline()).decode())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            message = {}
+        conference_server, data_type = self.route_data_connection(message)
+        if conference_server is None:
+            response = {"status": "error", "message": f"Unknown conference or data type: {message}"}
             writer.write((json.dumps(response) + "\n").encode())
             await writer.drain()
-            print(f"[Error] Conference {conference_id} not found for cancellation.")
+            writer.close()
+            print(f"[Error] Data connection rejected: {message}")
+            return
+        writer.write((json.dumps({"status": "success"}) + "\n").encode())
+        await writer.drain()
+        if data_type == 'text':
+            await conference_server.handle_text_client(reader, writer, data_type)
+        else:
+            await conference_server.handle_media_client(reader, writer, data_type)
+
+    async def datagram_handler(self, reader, writer):
+        """
+        Route a UDP peer on the shared data port by the payload of its FRAME_HELLO.
+        """
+        frame = await read_frame(reader)
+        message = {}
+        if frame is not None and frame[0].frame_type == FRAME_HELLO:
+            try:
+                message = json.loads(frame[1].decode())
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                pass
+        conference_server, data_type = self.route_data_connection(message)
+        if conference_server is None or data_type not in UDP_DATA_TYPES:
+            writer.close()
+            return
+        await conference_server.handle_media_client(reader, writer, data_type)
+
+    def get_load(self):
+        """
+        Load of the conferences hosted in this process, used to place new conferences on workers.
+        """
+        return {
+            'pid': os.getpid(),
+            'conferences': len(self.conference_servers),
+            'clients': sum(len(conference_server.clients['text'])
+                           for conference_server in self.conference_servers.values()),
+            'cpu': time.process_time(),
+        }
+
+    def pick_worker(self):
+        """
+        Least loaded healthy worker, by connected clients then hosted conferences.
+        """
+        healthy = [worker for worker in self.workers if worker.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda worker: (worker.load.get('clients', 0), len(worker.conferences)))
+
+    async def forward_request(self, message, writer):
+        """
+        Control-plane mode: run a conference action on the worker hosting the conference
+        (a new conference goes to the least loaded worker) and relay its response to the client.
+        """
+        action = message.get("action")
+        worker = None
+        if action == "create":
+            worker = self.pick_worker()
+            message = dict(message, conference_id=self.new_conference_id())
+        else:
+            if action == "quickJoin":  # 测试用
+                message = dict(message, action="join", conference_id=next(iter(self.conference_workers), None))
+            worker = self.conference_workers.get(str(message.get("conference_id")))
+        if worker is None:
+            response = {"status": "error", "message": f"No worker for {action} {message.get('conference_id')}."}
+        else:
+            response = await worker.request(message)
+        if response is None:
+            response = {"status": "error", "message": f"Conference worker {worker.worker_id} did not respond."}
+        elif response.get("status") == "success":
+            conference_id = str(response.get("conference_id", message.get("conference_id")))
+            if action == "create":
+                self.conference_workers[conference_id] = worker
+                worker.conferences.add(conference_id)
+            elif action == "cancel":
+                self.conference_workers.pop(conference_id, None)
+                worker.conferences.discard(conference_id)
+            if "ports" in response:
+                # 数据连接直接连到 worker 进程, client_id 以主连接为准
+                response.update(data_addr=worker.data_addr, client_id=get_client_id(writer), worker=worker.worker_id)
+        writer.write((json.dumps(response) + "\n").encode())
+        await writer.drain()
+
+    async def monitor_workers(self):
+        """
+        Ping every worker for its load; restart a worker whose process died and forget its conferences.
+        """
+        while True:
+            for worker in self.workers:
+                if not worker.process.is_alive():
+                    print(f"[Error] Conference worker {worker.worker_id} died, restarting.")
+                    for conference_id in worker.conferences:
+                        self.conference_workers.pop(conference_id, None)
+                    worker.conferences.clear()
+                    worker.start()
+                    await worker.connect()
+                    continue
+                if worker.writer is None:
+                    await worker.connect()
+                response = await worker.request({"action": "load"})
+                worker.healthy = bool(response and response.get("status") == "success")
+                if worker.healthy:
+                    worker.load = response["load"]
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL)
 
     async def request_handler(self, reader, writer):
         """
@@ -355,13 +1091,24 @@ class MainServer:
                 message = json.loads(data.decode())
                 action = message.get("action")
                 print(f"Received action: {action} with message: {message}")
+                REQUESTS.inc(str(action))
 
-                if action == "create":
-                    await self.create_conference(writer)
+                if self.workers and action in WORKER_ACTIONS:
+                    await self.forward_request(message, writer)
+                elif action == "workers":
+                    response = {"status": "success", "workers": [worker.get_stats() for worker in self.workers]}
+                    writer.write((json.dumps(response) + "\n").encode())
+                    await writer.drain()
+                elif action == "load":  # health check from the control plane
+                    response = {"status": "success", "load": self.get_load()}
+                    writer.write((json.dumps(response) + "\n").encode())
+                    await writer.drain()
+                elif action == "create":
+                    await self.create_conference(writer, message)
                 elif action == "join":
                     conference_id = message.get("conference_id")
                     if conference_id:
-                        await self.join_conference(conference_id, writer)
+                        await self.join_conference(conference_id, writer, message)
                     else:
                         response = {"status": "error", "message": "Missing conference_id for join action."}
                         writer.write((json.dumps(response) + "\n").encode())
@@ -369,7 +1116,7 @@ class MainServer:
                 elif action == 'quickJoin':  # 测试用
                     conference_id = int(list(self.conference_servers.items())[0][0])  # 第一个
                     if conference_id:
-                        await self.join_conference(conference_id, writer)
+                        await self.join_conference(conference_id, writer, message)
                     else:
                         response = {"status": "error", "message": "Missing conference_id for join action."}
                         writer.write((json.dumps(response) + "\n").encode())
@@ -390,6 +1137,17 @@ class MainServer:
                         response = {"status": "error", "message": "Missing conference_id for cancel action."}
                         writer.write((json.dumps(response) + "\n").encode())
                         await writer.drain()
+                elif action == "stats":
+                    conference_id_str = str(message.get("conference_id"))
+                    if conference_id_str in self.conference_servers:
+                        response = {"status": "success",
+                                    "conference_id": conference_id_str,
+                                    "stats": self.conference_servers[conference_id_str].get_stats(),
+                                    "port_pool": self.pool.get_stats()}
+                    else:
+                        response = {"status": "error", "message": f"Conference {conference_id_str} not found."}
+                    writer.write((json.dumps(response) + "\n").encode())
+                    await writer.drain()
                 elif action == "share":
                     conference_id = message.get("conference_id")
                     data_type = message.get("data_type")
@@ -423,9 +1181,16 @@ class MainServer:
                 print('我能怎么办，我也很绝望')
                 print(reader, writer)
                 break
+            except asyncio.CancelledError:  # 服务器关闭
+                writer.close()
+                return
             except Exception as e:
                 print(f"[Error] Exception in request handler: {str(e)}")
                 traceback.print_exc()
+                # 每个请求都要有一行响应, 否则客户端(或控制面)会一直等待
+                response = {"status": "error", "message": str(e)}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
 
         # Close the connection if the client disconnects
         writer.close()
@@ -435,12 +1200,220 @@ class MainServer:
 
     async def server_task(self):
         """
-        Coroutine that starts the asyncio server.
+        Coroutine that starts the asyncio server. It runs until SIGTERM/SIGINT (in a worker also until the
+        control plane process exits), then stops the worker processes so none is left holding its ports.
         """
+        loop = asyncio.get_running_loop()
         server = await asyncio.start_server(self.request_handler, self.server_ip, self.server_port)
         print(f"Main server started on {self.server_ip}:{self.server_port}")
-        async with server:
-            await server.serve_forever()
+        tasks = [server.serve_forever()]
+        if self.metrics_port:
+            tasks.append(METRICS.serve(METRICS_IP, self.metrics_port))
+        if self.workers:
+            for worker in self.workers:
+                worker.start()
+            for worker in self.workers:
+                await worker.connect()
+            tasks.append(self.monitor_workers())
+        elif self.multiplexed:
+            data_server = await asyncio.start_server(self.data_handler, self.data_ip, self.data_port)
+            await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: MediaDatagramProtocol(self.datagram_handler), local_addr=(self.data_ip, self.data_port))
+            print(f"Shared data port started on {self.data_ip}:{self.data_port}")
+            tasks.append(data_server.serve_forever())
+
+        stopped = loop.create_future()
+        stop = lambda reason: stopped.done() or stopped.set_result(reason)
+        for signum in (signal.SIGTERM, signal.SIGINT):  # worker 进程已经启动, 不会继承这些处理函数
+            loop.add_signal_handler(signum, stop, signal.Signals(signum).name)
+        if self.parent_sentinel is not None:
+            def control_plane_exited():
+                loop.remove_reader(self.parent_sentinel)
+                stop('control plane exited')
+            loop.add_reader(self.parent_sentinel, control_plane_exited)
+        running = asyncio.gather(*tasks)
+        try:
+            await asyncio.wait([running, stopped], return_when=asyncio.FIRST_COMPLETED)
+            if stopped.done():
+                print(f"Server on port {self.server_port} stopping: {stopped.result()}.")
+            else:
+                running.result()
+        finally:
+            running.cancel()
+            try:
+                await running
+            except asyncio.CancelledError:
+                pass
+            self.stop_workers()
+
+    def stop_workers(self):
+        """
+        Terminate every worker process, then wait for all of them.
+        """
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
+
+
+class WorkerHandle:
+    def __init__(self, worker_id, control_port, data_port, data_addr):
+        """
+        Control-plane side of one ConferenceWorker process.
+
+        :param control_port: localhost port of the worker's JSON request channel
+        :param data_port: shared data port of the worker, handed to clients of its conferences
+        :param data_addr: address clients use to reach the worker's data port
+        """
+        self.worker_id = worker_id
+        self.control_port = control_port
+        self.data_port = data_port
+        self.data_addr = data_addr
+        self.process = None
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()  # one request in flight per control connection
+        self.healthy = False
+        self.load = {}
+        self.conferences = set()
+        self.failures = 0
+
+    def start(self):
+        self.process = multiprocessing.Process(target=run_worker, daemon=True,
+                                               args=(self.worker_id, self.control_port, self.data_port))
+        self.process.start()
+        print(f"Conference worker {self.worker_id} started, pid {self.process.pid}.")
+
+    def terminate(self):
+        """
+        Ask the worker process to stop (SIGTERM); it closes its listeners and conferences.
+        """
+        self.healthy = False
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.process and self.process.is_alive():
+            self.process.terminate()
+
+    def join(self, timeout=WORKER_TIMEOUT):
+        """
+        Wait for a terminated worker process, killing it if it does not exit in time.
+        """
+        if self.process is None:
+            return
+        self.process.join(timeout)
+        if self.process.is_alive():
+            print(f"[Error] Conference worker {self.worker_id} did not stop, killing it.")
+            self.process.kill()
+            self.process.join()
+        print(f"Conference worker {self.worker_id} stopped, exit code {self.process.exitcode}.")
+
+    async def connect(self, attempts=50):
+        """
+        Open the control connection, waiting for the freshly started process to listen.
+        """
+        for _ in range(attempts):
+            try:
+                self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.control_port)
+                self.healthy = True
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+        print(f"[Error] Cannot reach conference worker {self.worker_id} on port {self.control_port}.")
+
+    async def request(self, message, timeout=WORKER_TIMEOUT):
+        """
+        Send one request line and wait for its response line.
+
+        :return: response dict, or None if the worker is unreachable or too slow
+        """
+        async with self.lock:
+            if self.writer is None:
+                return None
+            try:
+                self.writer.write((json.dumps(message) + "\n").encode())
+                await self.writer.drain()
+                data = await asyncio.wait_for(self.reader.readline(), timeout)
+                if data:
+                    return json.loads(data.decode())
+            except (OSError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                print(f"[Error] Conference worker {self.worker_id} request {message.get('action')} failed: {e!r}")
+            # 连接已不可靠(可能残留迟到的响应), 断开后由 monitor_workers 处理
+            self.failures += 1
+            self.healthy = False
+            self.writer.close()
+            self.writer = None
+            return None
+
+    def get_stats(self):
+        return {
+            'worker_id': self.worker_id,
+            'pid': self.process.pid if self.process else None,
+            'alive': bool(self.process and self.process.is_alive()),
+            'healthy': self.healthy,
+            'data_port': self.data_port,
+            'conferences': len(self.conferences),
+            'failures': self.failures,
+            'load': self.load,
+        }
+
+
+class ConferenceWorker(MainServer):
+    def __init__(self, worker_id, control_port, data_port):
+        """
+        Hosts conferences in its own process. It answers the usual conference actions on a localhost
+        control port for the control plane, and serves its conferences on its own shared data port.
+        It exits when the control plane process does, even if that one was killed.
+        """
+        super().__init__('127.0.0.1', control_port, workers=0)
+        self.worker_id = worker_id
+        parent = multiprocessing.parent_process()  # 其 sentinel 是父进程持有写端的管道, 父进程退出时读到 EOF
+        self.parent_sentinel = parent.sentinel if parent else None
+        self.data_ip = SERVER_IP
+        self.data_port = data_port
+        self.multiplexed = True
+        self.metrics_port = METRICS_PORT + 1 + worker_id if METRICS_PORT else None  # 每个 worker 进程单独抓取
+
+
+def run_worker(worker_id, control_port, data_port):
+    # 重启的 worker 是在控制面装好信号处理后 fork 的, 先恢复默认, server_task 再装自己的
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    asyncio.run(ConferenceWorker(worker_id, control_port, data_port).server_task())
+
+def negotiate_transport(message, data_ports):
+    """
+    Media transport part of a create/join response.
+
+    :return: {'transport': 'udp', 'udp_ports': {...}} if the client asked for UDP, else {'transport': 'tcp'}
+    """
+    if message.get("transport") != 'udp':
+        return {"transport": 'tcp'}
+    return {"transport": 'udp', "udp_ports": {data_type: data_ports[data_type] for data_type in UDP_DATA_TYPES}}
+
+
+def parse_canvas_size(value):
+    """
+    :param value: [width, height] a create request asked for, or None
+    :return: (width, height) of the conference composite, CANVAS_SIZE if missing or out of range
+    """
+    try:
+        width, height = int(value[0]), int(value[1])
+    except (TypeError, ValueError, IndexError):
+        return CANVAS_SIZE
+    if not (160 <= width <= MAX_CANVAS_SIZE[0] and 90 <= height <= MAX_CANVAS_SIZE[1]):
+        return CANVAS_SIZE
+    return width, height
+
+
+def negotiate_simulcast(message, video_mode, video_codec):
+    """
+    :return: True if the client should publish simulcast camera layers: it asked for it and the
+             conference relays JPEG frames (a composite is built from the full layer anyway)
+    """
+    return bool(message.get("simulcast")) and video_mode == 'relay' and video_codec == 'jpeg'
+
 
 def get_client_id(writer):
     addr = writer.get_extra_info('peername')
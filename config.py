@@ -1,7 +1,8 @@
 HELP = 'Create         : create an conference\n' \
        'Join [conf_id ]: join a conference with conference ID\n' \
        'Quit           : quit an on-going conference\n' \
-       'Cancel         : cancel your on-going conference (only the manager)\n\n'
+       'Cancel         : cancel your on-going conference (only the manager)\n' \
+       'Trace          : camera frame latency per stage (TRACE_FRAMES), dumped to TRACE_FILE\n\n'
 
 HELP2 = 'send [message]\n'\
         'switch [audio/screen/video]\n'\
@@ -11,7 +12,7 @@ HELP2 = 'send [message]\n'\
 SERVER_IP = '127.0.0.1'
 MAIN_SERVER_PORT = 8888
 TIMEOUT_SERVER = 5
-# DGRAM_SIZE = 1500  # UDP
+DGRAM_SIZE = 1400  # UDP payload per datagram, below a typical 1500-byte MTU
 LOG_INTERVAL = 2
 
 CHUNK = 1024 # 单个音频块数据的大小
@@ -19,3 +20,98 @@ CHANNELS = 1  # Channels for audio capture
 RATE = 44100  # Sampling rate for audio capture
 
 camera_width, camera_height = 480, 480  # resolution for camera capture
+
+# 'compose': server decodes camera frames and broadcasts one composite JPEG
+# 'relay'  : server forwards each camera/screen frame untouched, clients composite (SFU style)
+VIDEO_MODE = 'compose'
+VIDEO_MODES = ('compose', 'relay')
+COMPOSE_FPS = 20  # compose mode: frame clock of the composite; a late tick is skipped, not replayed
+BROADCAST_DRAIN_TIMEOUT = 0.5  # seconds a broadcast waits for any single receiver to drain
+# per-receiver outbound queue depth on the media ports; the oldest frame is dropped when full
+# (video/screen keep only the newest frames, audio keeps a few blocks to absorb jitter; screen deltas need room
+# behind the keyframe they apply on, see Subscriber.put)
+SEND_QUEUE_DEPTH = {'audio': 8, 'video': 2, 'screen': 2}
+
+# image codec / compositing work runs off the event loop
+CODEC_EXECUTOR = 'thread'  # 'thread' or 'process'
+CODEC_WORKERS = 4
+CODEC_MAX_PENDING = 16  # calls in flight before callers wait (backpressure)
+
+# server-side audio mixing: each listener receives one N-1 mix instead of every other stream
+AUDIO_MIX = True
+AUDIO_MIX_MAX_DEPTH = 4  # blocks queued per speaker; older blocks are dropped to stay aligned
+
+# streaming noise suppression: where it runs ('sender', 'server', 'receiver' or None to disable)
+DENOISE_AT = 'receiver'
+DENOISE_FFT_SIZE = 512  # CHUNK must be a multiple of DENOISE_FFT_SIZE // 2
+
+# adaptive jitter buffer for received audio, target delay in CHUNK-sized blocks
+JITTER_MIN_BLOCKS = 2
+JITTER_MAX_BLOCKS = 12
+
+# capture threads: target rate (None: paced by the blocking read) and values kept for the sender
+CAPTURE_FPS = {'audio': None, 'video': 20, 'screen': 20}
+CAPTURE_DEPTH = {'audio': 8, 'video': 1, 'screen': 1}
+
+# screen sharing sends only changed tiles, with a full keyframe every SCREEN_KEYFRAME_INTERVAL frames
+SCREEN_TILE_SIZE = 64
+SCREEN_KEYFRAME_INTERVAL = 40
+SCREEN_QUALITY = 60
+KEYFRAME_REQUEST_INTERVAL = 0.5  # seconds; the server asks a publisher for a keyframe at most this often
+
+# client-side rate control of camera/screen streams, driven by drain latency and send-buffer growth
+# (over UDP, where drain() returns at once, by the loss share in the server's periodic reports)
+CAMERA_QUALITY = 85  # JPEG quality (VP8/H.264: share of VIDEO_BITRATE) every client's camera stream starts at
+RATE_DRAIN_HIGH = 0.05  # seconds; average drain time above this means congestion
+RATE_DRAIN_LOW = 0.01  # seconds; below this the link has headroom
+RATE_BUFFER_HIGH = 256 * 1024  # bytes waiting in the socket send buffer
+RATE_LOSS_HIGH = 0.05  # UDP: share of frames the server reported lost above which the link is congested
+RATE_LOSS_LOW = 0.01
+RATE_HOLD_FRAMES = 10  # frames to wait after a step down before judging again
+RATE_RECOVER_FRAMES = 40  # good frames in a row before stepping back up
+RATE_SCALES = (1.0, 0.75, 0.5)  # resolution factors applied to camera_width x camera_height
+
+# relay mode simulcast: the camera is published as several layers from one capture (JPEG only),
+# the server forwards each receiver the layer its viewport and link can take
+SIMULCAST = False
+SIMULCAST_LAYERS = ((1.0, 85), (0.5, 70), (0.25, 60))  # (scale of camera_width x camera_height, JPEG quality)
+
+# camera codec preferred for new conferences: 'jpeg' (every frame self-contained) or 'vp8' / 'h264'
+# (inter-frame, needs PyAV; a lost packet costs a keyframe request, see KEYFRAME_REQUEST_INTERVAL)
+VIDEO_CODEC = 'jpeg'
+VIDEO_KEYFRAME_INTERVAL = 40  # frames between keyframes
+VIDEO_BITRATE = 600000  # bits per second at JPEG-equivalent quality 100, scaled by the rate controller
+
+# media transport requested by clients: 'tcp' or 'udp' (audio and video only, screen deltas stay on TCP)
+MEDIA_TRANSPORT = 'tcp'
+UDP_DATA_TYPES = ('audio', 'video')
+REASSEMBLY_TIMEOUT = 0.5  # seconds before an incomplete fragmented frame is dropped as lost
+UDP_KEEPALIVE_INTERVAL = 2  # seconds; clients send an empty FRAME_HELLO, the server a loss report to each peer
+UDP_PEER_TIMEOUT = 10  # seconds without a datagram before the server closes a UDP peer
+
+# one shared data port for every conference; clients route each data connection with a handshake line
+MULTIPLEX_DATA_PORT = True
+DATA_PORT = 8889
+PORT_QUARANTINE_TTL = 30  # seconds a released conference port rests before it is handed out again
+
+# multi-process mode: MainServer only places conferences on worker processes, 0 keeps everything in one process
+CONFERENCE_WORKERS = 0
+WORKER_CONTROL_PORT = 8890  # worker i listens for control requests on localhost:WORKER_CONTROL_PORT + i
+WORKER_DATA_PORT = 8900  # and serves its conferences on WORKER_DATA_PORT + i
+WORKER_HEALTH_INTERVAL = 2  # seconds between load pings
+WORKER_TIMEOUT = 5  # seconds a worker may take to answer one request
+
+CANVAS_SIZE = (1920, 1080)  # server composite size, also the display size assumed on headless hosts
+MAX_CANVAS_SIZE = (3840, 2160)  # largest composite a create request may ask for with 'canvas_size'
+# compose mode: the composite is also sent at these sizes (no larger than the conference canvas);
+# each receiver gets the smallest tier covering its viewport, and each tier in use is encoded once per frame
+CANVAS_TIERS = ((1920, 1080), (1280, 720), (640, 360))
+
+# Prometheus-style metrics endpoint, http://METRICS_IP:METRICS_PORT/metrics (workers use METRICS_PORT + 1 + i)
+METRICS_IP = '127.0.0.1'
+METRICS_PORT = 9100  # None disables it
+
+# opt-in per-frame latency tracing of camera frames (capture -> server -> render), adds ~20 bytes per span
+TRACE_FRAMES = False
+TRACE_WINDOW = 300  # frames kept for the rolling breakdown
+TRACE_FILE = 'frame_trace.json'  # Chrome trace JSON written on quit / by the 'trace' command
@@ -0,0 +1,492 @@
+# 服务器和客户端共用的轻量核心: 帧协议、编解码、合成、端口池
+# 不导入任何设备或 GUI 库, 在无显示器/麦克风/摄像头的机器上也能导入
+from config import *
+from protocol import *
+from codec_executor import *
+from audio_processing import *
+from screen_delta import *
+from rate_control import *
+from video_codec import *
+from udp_transport import *
+from metrics import *
+from tracing import *
+
+from io import BytesIO
+import time
+import json
+import asyncio
+import threading
+from collections import deque
+import socket
+import traceback
+import numpy as np
+from PIL import Image
+
+
+def fit_size(size, my_screen_size):
+    """
+    :param size: (width, height) of the image
+    :return: (width, height) of the image scaled to fit my_screen_size, aspect ratio kept
+    """
+    screen_width, screen_height = my_screen_size
+    original_width, original_height = size
+    aspect_ratio = original_width / original_height
+    if screen_width / screen_height > aspect_ratio:
+        # resize according to height
+        return max(int(screen_height * aspect_ratio), 1), screen_height
+    # resize according to width
+    return screen_width, max(int(screen_width / aspect_ratio), 1)
+
+
+def to_rgb_array(image):
+    """
+    :param image: PIL.Image or HxWx3 uint8 RGB array
+    :return: HxWx3 uint8 RGB array
+    """
+    if isinstance(image, Image.Image):
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return np.asarray(image)
+    return image
+
+
+def resize_array(array, size, dst=None):
+    """
+    cv2.resize with INTER_AREA (box filter: much cheaper than LANCZOS and alias-free when shrinking).
+
+    :param size: (width, height)
+    :param dst: optional preallocated HxWx3 array of that size, written in place
+    """
+    import cv2  # 延迟导入, 只有合成时才需要
+    if array.shape[1] == size[0] and array.shape[0] == size[1]:
+        if dst is None:
+            return array
+        np.copyto(dst, array)
+        return dst
+    return cv2.resize(array, size, dst=dst, interpolation=cv2.INTER_AREA)
+
+
+def fit_array(array, my_screen_size):
+    return resize_array(array, fit_size((array.shape[1], array.shape[0]), my_screen_size))
+
+
+def resize_image_to_fit_screen(image, my_screen_size):
+    return Image.fromarray(fit_array(to_rgb_array(image), my_screen_size))
+
+
+def camera_tile_size(camera_size):
+    """
+    :return: (width, height) of a camera tile, 60% of the camera frame
+    """
+    camera_width, camera_height = camera_size
+    return max(int(camera_width * 0.6), 1), max(int(camera_height * 0.6), 1)
+
+
+def camera_tile_layout(count, camera_size, canvas_size):
+    """
+    Positions of the camera tiles on the composite, clipped to the canvas.
+
+    :param camera_size: (width, height) of the first camera frame, sets the grid pitch
+    :param canvas_size: (width, height) of the composite
+    :return: list of (x, y, width, height) visible region of each tile, width/height 0 if off canvas
+    """
+    camera_width, camera_height = camera_size
+    tile_width, tile_height = camera_tile_size(camera_size)
+    canvas_width, canvas_height = canvas_size
+    num_cameras_per_row = max(canvas_width // camera_width, 1)
+    layout = []
+    for i in range(count):
+        row = i // num_cameras_per_row
+        col = i % num_cameras_per_row
+        x = int(col * camera_width * 0.8 + camera_width * 0.7)
+        y = int(row * camera_height * 0.8)
+        layout.append((x, y, max(min(tile_width, canvas_width - x), 0), max(min(tile_height, canvas_height - y), 0)))
+    return layout
+
+
+def canvas_tiers(canvas_size, tiers=CANVAS_TIERS):
+    """
+    :return: list of (width, height) a conference's composite is offered at, the canvas itself first
+    """
+    sizes = {tuple(canvas_size)} | {tuple(tier) for tier in tiers
+                                    if tier[0] <= canvas_size[0] and tier[1] <= canvas_size[1]}
+    return sorted(sizes, reverse=True)
+
+
+def pick_canvas_tier(tiers, viewport):
+    """
+    Smallest tier at least as wide as the composite appears in the viewport (scaled to fit, aspect ratio kept).
+
+    :param tiers: list from canvas_tiers, largest (the canvas) first
+    :param viewport: (width, height) the receiver displays the composite at
+    """
+    shown_width, _ = fit_size(tiers[0], viewport)
+    for tier in reversed(tiers):
+        if fit_size(tiers[0], tier)[0] >= shown_width:
+            return tier
+    return tiers[0]
+
+
+def overlay_camera_images(screen_image, camera_images, my_screen_size=CANVAS_SIZE, camera_size=None): #把投屏信息和摄像头信息合在一张图片上
+    """
+    screen_image: PIL.Image
+    camera_images: list[PIL.Image]
+    my_screen_size: (width, height) the result is fitted to, the local display on clients
+    camera_size: (width, height) the tiles are laid out for, every camera is scaled to its tile;
+                 None uses the first camera's size, and then all cameras must have that size
+    """
+    if screen_image is None and camera_images is None:
+        # print('[Warn]: cannot display when screen and camera are both None')
+        return None
+
+    if screen_image is not None:
+        screen = fit_array(to_rgb_array(screen_image), my_screen_size)
+
+    if camera_images is not None:
+        cameras = [to_rgb_array(img) for img in camera_images]
+        if camera_size is None:
+            # make sure same camera images
+            if not all(camera.shape == cameras[0].shape for camera in cameras):
+                raise ValueError("All camera images must have the same size")
+            camera_size = (cameras[0].shape[1], cameras[0].shape[0])
+
+        # if no screen_img, create a container
+        if screen_image is None:
+            canvas = np.zeros((my_screen_size[1], my_screen_size[0], 3), dtype=np.uint8)
+        else:
+            canvas = screen.copy()
+        # cover screen_img using camera_images
+        tile_size = camera_tile_size(camera_size)
+        canvas_size = (canvas.shape[1], canvas.shape[0])
+        for (x, y, width, height), camera in zip(camera_tile_layout(len(cameras), camera_size, canvas_size), cameras):
+            if width and height:
+                canvas[y:y + height, x:x + width] = resize_array(camera, tile_size)[:height, :width]
+        return Image.fromarray(canvas)
+    else:
+        return Image.fromarray(screen)
+
+
+class Compositor:
+    def __init__(self, background, screen_size=CANVAS_SIZE):
+        """
+        Incremental version of overlay_camera_images for the server's playVideo loop.
+        It keeps the last composed canvas and only redraws what changed since the previous
+        compose(): a new screen or a roster change redraws everything, a new camera frame
+        only repaints that camera's tile.
+
+        The canvas and each camera's scaled tile are preallocated NumPy arrays, resized into with
+        cv2 (INTER_AREA); a full redraw reuses the scaled tile of every camera without a new frame,
+        and the tile layout is only recomputed on a full redraw.
+
+        set_screen/set_camera/remove_camera only record the change under a lock, so they are
+        cheap on the event loop while compose() runs in the codec executor.
+
+        :param background: PIL.Image, shown when nobody shares the screen (decoded once)
+        :param screen_size: (width, height) of the composite, independent of the server's own display
+        """
+        self.screen_size = screen_size
+        self.background = fit_array(to_rgb_array(background), screen_size)
+        self.lock = threading.Lock()
+        self.pending_screen = None
+        self.screen_changed = False
+        self.pending_cameras = {}  # client_id: PIL.Image received since the last compose()
+        self.removed_cameras = set()
+        self.redraw_requested = False
+
+        self.screen = None  # fitted shared screen, HxWx3 array
+        self.cameras = {}  # client_id: HxWx3 array, latest frame of each camera
+        self.tiles = {}  # client_id: HxWx3 array, that frame scaled to the tile size
+        self.stale_tiles = set()  # client_id whose tile is older than its frame
+        self.order = []  # client_id of each tile, in layout order
+        self.layout = []  # (x, y, width, height) of each tile, in layout order
+        self.full_redraw = True
+        self.canvas = None
+        self.tile_size = None  # (width, height) of a scaled tile
+        self.camera_size = None  # (width, height) of the first camera, as in overlay_camera_images
+        self.stats = {'composes': 0, 'full_redraws': 0, 'tiles_scaled': 0, 'tiles_reused': 0}
+
+    def set_screen(self, image):
+        with self.lock:
+            self.pending_screen = image
+            self.screen_changed = True
+
+    def set_camera(self, client_id, image):
+        with self.lock:
+            self.pending_cameras[client_id] = image
+            self.removed_cameras.discard(client_id)
+
+    def remove_camera(self, client_id):
+        with self.lock:
+            self.pending_cameras.pop(client_id, None)
+            self.removed_cameras.add(client_id)
+
+    def invalidate(self):
+        """
+        Make the next compose() return a frame even if nothing changed (e.g. a new canvas tier needs one).
+        """
+        with self.lock:
+            self.redraw_requested = True
+
+    def paste_camera(self, index):
+        client_id = self.order[index]
+        x, y, width, height = self.layout[index]
+        if not width or not height:
+            return
+        tile = self.tiles.get(client_id)
+        shape = (self.tile_size[1], self.tile_size[0], 3)
+        if tile is None or tile.shape != shape:  # 新参与者或第一个摄像头的尺寸变了
+            tile = self.tiles[client_id] = np.empty(shape, dtype=np.uint8)
+            self.stale_tiles.add(client_id)
+        if client_id in self.stale_tiles:
+            resize_array(self.cameras[client_id], self.tile_size, dst=tile)
+            self.stale_tiles.discard(client_id)
+            self.stats['tiles_scaled'] += 1
+        else:
+            self.stats['tiles_reused'] += 1
+        self.canvas[y:y + height, x:x + width] = tile[:height, :width]
+
+    def compose(self):
+        """
+        :return: PIL.Image, the updated canvas, or None if nothing changed since the last call
+        """
+        with self.lock:
+            screen_changed, screen = self.screen_changed, self.pending_screen
+            cameras, removed = self.pending_cameras, self.removed_cameras
+            self.screen_changed = False
+            self.pending_cameras, self.removed_cameras = {}, set()
+            if self.redraw_requested:
+                self.full_redraw = True
+                self.redraw_requested = False
+
+        if screen_changed:
+            self.screen = fit_array(to_rgb_array(screen), self.screen_size) if screen is not None else None
+            self.full_redraw = True
+        for client_id in removed:
+            if self.cameras.pop(client_id, None) is not None:
+                self.order.remove(client_id)
+                self.tiles.pop(client_id, None)
+                self.stale_tiles.discard(client_id)
+                self.full_redraw = True
+        for client_id, image in cameras.items():
+            if client_id not in self.cameras:
+                self.order.append(client_id)
+                self.full_redraw = True
+            self.cameras[client_id] = to_rgb_array(image)
+            self.stale_tiles.add(client_id)
+
+        if not self.full_redraw and not cameras:
+            return None
+        self.stats['composes'] += 1
+        if self.full_redraw:
+            base = self.screen if self.screen is not None else self.background
+            if self.canvas is None or self.canvas.shape != base.shape:
+                self.canvas = np.empty_like(base)
+            np.copyto(self.canvas, base)
+            if self.order:
+                first = self.cameras[self.order[0]]
+                self.camera_size = (first.shape[1], first.shape[0])
+                self.tile_size = camera_tile_size(self.camera_size)
+                self.layout = camera_tile_layout(len(self.order), self.camera_size,
+                                                 (self.canvas.shape[1], self.canvas.shape[0]))
+            dirty = range(len(self.order))
+            self.stats['full_redraws'] += 1
+        else:
+            dirty = [self.order.index(client_id) for client_id in cameras]
+        for index in dirty:
+            self.paste_camera(index)
+        self.full_redraw = False
+        return Image.fromarray(self.canvas)
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+def compress_image(image, format='JPEG', quality=85):
+    """
+    compress image and output Bytes
+
+    :param image: PIL.Image, input image
+    :param format: str, output format ('JPEG', 'PNG', 'WEBP', ...)
+    :param quality: int, compress quality (0-100), 85 default
+    :return: bytes, compressed image data
+    """
+    img_byte_arr = BytesIO()
+    image.save(img_byte_arr, format=format, quality=quality)
+    img_byte_arr = img_byte_arr.getvalue()
+    return img_byte_arr
+
+
+def compress_fitted_image(image, size, quality=85):
+    """
+    Shrink an image to fit size (INTER_AREA, aspect ratio kept, never enlarged) then compress it,
+    as done once per canvas tier.
+
+    :param image: PIL.Image
+    :param size: (width, height) of the tier
+    :return: bytes, JPEG data
+    """
+    fitted = fit_size(image.size, size)
+    if fitted[0] < image.width:
+        image = Image.fromarray(resize_array(to_rgb_array(image), fitted))
+    return compress_image(image, quality=quality)
+
+
+def compress_layers(image, layers=SIMULCAST_LAYERS, scale=1.0, quality=85):
+    """
+    Encode every simulcast layer of one captured camera frame; each layer is shrunk (INTER_AREA)
+    from the previous one, so the frame is converted once and every resize works on less data.
+
+    :param image: PIL.Image, captured camera frame
+    :param layers: (scale, JPEG quality) of each layer, largest first
+    :param scale: float, rate controller resolution factor applied on top of every layer
+    :param quality: int, rate controller JPEG quality, caps the quality of every layer
+    :return: list of (flags, bytes), flags carrying the layer index
+    """
+    array = to_rgb_array(image)
+    width, height = image.size
+    encoded = []
+    for layer, (layer_scale, layer_quality) in enumerate(layers):
+        size = (max(int(width * layer_scale * scale), 1), max(int(height * layer_scale * scale), 1))
+        array = resize_array(array, size)
+        encoded.append((layer_flags(layer), compress_image(Image.fromarray(array), quality=min(layer_quality, quality))))
+    return encoded
+
+
+def compress_scaled_image(image, scale=1.0, quality=85):
+    """
+    Downscale then compress an image, as chosen by the rate controller.
+
+    :param image: PIL.Image, input image
+    :param scale: float, resolution factor (1.0 keeps the captured size)
+    :param quality: int, JPEG quality
+    :return: bytes, compressed image data
+    """
+    if scale != 1.0:
+        image = image.resize((max(int(image.width * scale), 1), max(int(image.height * scale), 1)), Image.BILINEAR)
+    return compress_image(image, quality=quality)
+
+
+def decompress_image(image_bytes):
+    """
+    decompress bytes to PIL.Image
+    :param image_bytes: bytes, compressed data
+    :return: PIL.Image
+    """
+    img_byte_arr = BytesIO(image_bytes)
+    image = Image.open(img_byte_arr)
+    image.load()  # decode now (Image.open is lazy), so the work happens where this is called
+
+    return image
+
+# 用来记录已经使用的端口
+class PortPool:
+    def __init__(self, start_port, end_port, quarantine_ttl=PORT_QUARANTINE_TTL):
+        """
+        端口池: 空闲端口放在双端队列里, 分配和释放都是 O(1)。
+
+        :param start_port: 端口范围起点
+        :param end_port: 端口范围终点(包含)
+        :param quarantine_ttl: 释放的端口隔离多少秒后才重新分配, 避免旧连接/TIME_WAIT 冲突
+        """
+        pool = list(range(start_port, end_port + 1))
+        np.random.shuffle(pool)  # 随机打乱端口池
+        self.free = deque(pool)  # 可分配的端口, 从左边取
+        self.used_ports = set()  # 使用集合存储已使用的端口
+        self.quarantine = deque()  # (释放时间, 端口), 按释放时间排序
+        self.quarantine_ttl = quarantine_ttl
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.failures = 0
+        self.probe_failures = 0  # 被其他程序占用而跳过的端口
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def get_ports(self, num_ports):
+        """
+        分配指定数量的可用端口。只检查取出的候选端口(惰性验证), 不再扫描整个端口池。
+
+        :param num_ports: 需要分配的端口数量
+        :return: 分配的端口列表，如果不足则返回None
+        """
+        start = time.perf_counter()
+        with self.lock:
+            self.expire_quarantine()
+            allocated_ports = []
+            busy = []
+            while len(allocated_ports) < num_ports and self.free:
+                port = self.free.popleft()
+                if self.is_port_free(port):
+                    allocated_ports.append(port)
+                else:
+                    busy.append(port)
+            # 被占用的端口先隔离, 过一段时间再试
+            now = time.monotonic()
+            self.quarantine.extend((now, port) for port in busy)
+            self.probe_failures += len(busy)
+            if len(allocated_ports) < num_ports:
+                # 如果可用端口不足，则归还已取出的端口并返回None
+                self.free.extendleft(reversed(allocated_ports))
+                self.failures += 1
+                allocated_ports = None
+            else:
+                self.used_ports.update(allocated_ports)
+                self.allocations += 1
+            elapsed = time.perf_counter() - start
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+        return allocated_ports
+
+    def release_ports(self, ports):
+        """
+        释放一组端口, 端口先进入隔离队列。
+
+        :param ports: 要释放的端口列表
+        """
+        with self.lock:
+            now = time.monotonic()
+            for port in ports:
+                if port in self.used_ports:
+                    self.used_ports.remove(port)
+                    self.quarantine.append((now, port))
+
+    def expire_quarantine(self):
+        """
+        把隔离期已过的端口放回空闲队列尾部。调用方需持有 self.lock。
+        """
+        deadline = time.monotonic() - self.quarantine_ttl
+        while self.quarantine and self.quarantine[0][0] <= deadline:
+            self.free.append(self.quarantine.popleft()[1])
+
+    def get_stats(self):
+        """
+        :return: dict, 端口数量和分配耗时统计
+        """
+        with self.lock:
+            requests = self.allocations + self.failures
+            return {
+                'free': len(self.free),
+                'used': len(self.used_ports),
+                'quarantined': len(self.quarantine),
+                'allocations': self.allocations,
+                'failures': self.failures,
+                'probe_failures': self.probe_failures,
+                'avg_ms': self.latency_total / requests * 1000 if requests else 0.0,
+                'max_ms': self.latency_max * 1000,
+            }
+
+    def is_port_free(self, port):
+        """
+        检查端口是否可用。
+
+        :param port: 要检查的端口号
+        :return: 如果端口可用返回True，否则返回False
+        """
+        try:
+            # 音视频在同一端口号上还有 UDP 端点, 两种协议都要空闲
+            for kind in (socket.SOCK_STREAM, socket.SOCK_DGRAM):
+                s = socket.socket(socket.AF_INET, kind)
+                s.bind(('localhost', port))
+                s.close()
+            return True
+        except socket.error:
+            return False
\ No newline at end of file
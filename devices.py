@@ -0,0 +1,92 @@
+# 本地设备: 麦克风、扬声器、摄像头和屏幕, 第一次使用时才打开
+# 服务器只导入 core, 不会占用这些设备
+import threading
+
+from PIL import Image
+
+from config import *
+
+_devices = {}
+_lock = threading.RLock()
+
+
+def _get_device(name, opener):
+    """
+    Open a device once, on first use, from whichever thread asks first.
+    """
+    with _lock:
+        if name not in _devices:
+            _devices[name] = opener()
+        return _devices[name]
+
+
+def get_pyaudio():
+    import pyaudio
+    return _get_device('pyaudio', pyaudio.PyAudio)
+
+
+def get_input_stream():
+    import pyaudio
+    return _get_device('streamin', lambda: get_pyaudio().open(
+        format=pyaudio.paInt16, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK))
+
+
+def get_output_stream():
+    import pyaudio
+    return _get_device('streamout', lambda: get_pyaudio().open(
+        format=pyaudio.paInt16, channels=CHANNELS, rate=RATE, output=True, frames_per_buffer=CHUNK))
+
+
+def _open_camera():
+    import cv2
+    cap = cv2.VideoCapture(0)
+    if cap.isOpened():
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, camera_width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_height)
+    return cap
+
+
+def get_camera():
+    return _get_device('camera', _open_camera)
+
+
+def can_capture_camera():
+    return get_camera().isOpened()
+
+
+def _screen_size():
+    try:
+        import pyautogui
+        return tuple(pyautogui.size())
+    except Exception:  # 没有显示器时退回默认尺寸
+        return CANVAS_SIZE
+
+
+def get_screen_size():
+    """
+    :return: (width, height) of the local display, CANVAS_SIZE on a headless host
+    """
+    return _get_device('screen_size', _screen_size)
+
+
+def capture_screen():
+    # capture screen with the resolution of display
+    # img = pyautogui.screenshot()
+    from PIL import ImageGrab
+    img = ImageGrab.grab()
+    return img
+
+
+def capture_camera():
+    # capture frame of camera
+    import cv2
+    ret, frame = get_camera().read()
+    if not ret:
+        raise Exception('Fail to capture frame from camera')
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    pil_image = Image.fromarray(frame_rgb)
+
+    return pil_image
+
+def capture_voice():
+    return get_input_stream().read(CHUNK) #从麦克风中读取音频数据
@@ -0,0 +1,173 @@
+# Prometheus 文本格式的运行指标: 计数器/直方图在热路径上只做字典加法, 仪表盘数值在抓取时才计算
+import asyncio
+import bisect
+import threading
+
+# seconds, from sub-millisecond fan-out to a slow full-HD compose
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        """
+        Monotonic counter; inc() is a dict update, safe to call on the hot path.
+
+        :param labels: label names, inc() takes the values in the same order
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}  # label values tuple: float
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Fixed-bucket histogram; observe() is a bisect and two dict updates.
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # label values tuple: [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                labels = format_labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {series[-1]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels=(), collect=None):
+        """
+        Value read at scrape time, so keeping it up to date costs nothing.
+
+        :param collect: callable returning a number, or {label values tuple: number} when labels are given
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.collect()
+        except Exception as e:  # 一个指标出错不影响其他指标
+            return lines + [f'# {self.name} collect failed: {e!r}']
+        if not self.labels:
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}  # name: metric, in registration order
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric; registering a name again replaces it (e.g. a gauge bound to a new server).
+        """
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self.register(Gauge(name, help, labels, collect))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    async def handle_http(self, reader, writer):
+        """
+        Minimal HTTP/1.0 responder: GET /metrics returns the exposition text, anything else 404.
+        """
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass  # 忽略请求头
+            parts = request.decode(errors='replace').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f'HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_http, host, port)
+        print(f"Metrics endpoint started on http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+
+METRICS = MetricsRegistry()
+
+FRAMES_IN = METRICS.counter('conf_frames_in_total', 'Media frames received from clients.', ('data_type',))
+BYTES_IN = METRICS.counter('conf_bytes_in_total', 'Media payload bytes received from clients.', ('data_type',))
+FRAMES_OUT = METRICS.counter('conf_frames_out_total', 'Frames and text lines written to clients.', ('data_type',))
+BYTES_OUT = METRICS.counter('conf_bytes_out_total', 'Bytes written to clients.', ('data_type',))
+FRAMES_DROPPED = METRICS.counter('conf_frames_dropped_total',
+                                 'Frames dropped from full subscriber queues.', ('data_type',))
+REQUESTS = METRICS.counter('conf_requests_total', 'Control requests on the main port.', ('action',))
+BROADCAST_SECONDS = METRICS.histogram('conf_broadcast_seconds',
+                                      'Time to fan one message out to a conference.', ('data_type',))
+DEADLINES_MISSED = METRICS.counter('conf_compose_deadlines_missed_total',
+                                   'playVideo ticks that finished after their frame deadline.')
+CAMERA_FRAMES_SKIPPED = METRICS.counter('conf_camera_frames_skipped_total',
+                                        'Camera frames replaced by a newer one before being composed.')
+LAYER_SWITCHES = METRICS.counter('conf_simulcast_layer_switches_total',
+                                 'Simulcast layer changes of relay-mode receivers.', ('direction',))
+COMPOSE_SECONDS = METRICS.histogram('conf_compose_seconds', 'playVideo compose time per frame.')
+ENCODE_SECONDS = METRICS.histogram('conf_encode_seconds', 'playVideo JPEG encode time per frame.')
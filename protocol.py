@@ -0,0 +1,109 @@
+# 媒体端口(audio/video/screen)使用的二进制帧格式
+# 每一帧 = 固定长度帧头 + 原始负载字节, 不再使用 JSON + base64 + '\n'
+import asyncio
+import struct
+import time
+from collections import namedtuple
+
+# type(1B) | flags(1B) | sender(4B) | seq(4B) | timestamp(8B, double) | payload length(4B)
+FRAME_HEADER = struct.Struct('!BBIIdI')
+
+FRAME_HELLO = 0  # empty frame a datagram client sends first, so the server learns its address
+FRAME_AUDIO = 1
+FRAME_VIDEO = 2
+FRAME_SCREEN = 3
+FRAME_KEYFRAME_REQUEST = 4  # empty frame from the server asking a publisher to send a keyframe next
+
+# flags
+FLAG_KEYFRAME = 0x01  # self-contained frame (full screen image)
+FLAG_DELTA = 0x02  # only changed screen tiles, applies on top of the previous frame
+FLAG_VP8 = 0x04  # camera payload is a VP8 packet instead of a JPEG
+FLAG_H264 = 0x08  # camera payload is an H.264 access unit instead of a JPEG
+FLAG_CODEC_MASK = FLAG_VP8 | FLAG_H264
+FLAG_TRACE = 0x10  # payload starts with trace spans (tracing.pack_trace)
+FLAG_LAYER_MASK = 0x60  # simulcast layer of a camera frame (0: full resolution), see frame_layer / layer_flags
+LAYER_SHIFT = 5
+
+FRAME_TYPES = {'audio': FRAME_AUDIO, 'video': FRAME_VIDEO, 'screen': FRAME_SCREEN}
+FRAME_DATA_TYPES = {frame_type: data_type for data_type, frame_type in FRAME_TYPES.items()}
+
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # 防止错误的长度字段导致一次性分配过大内存
+
+FrameHeader = namedtuple('FrameHeader', ['frame_type', 'flags', 'sender', 'seq', 'timestamp', 'length'])
+
+
+def pack_frame(frame_type, payload, sender=0, seq=0, timestamp=None, flags=0):
+    """
+    Pack one media frame into bytes.
+
+    :param frame_type: int, one of FRAME_AUDIO / FRAME_VIDEO / FRAME_SCREEN
+    :param payload: bytes, raw payload (PCM block, JPEG bytes, ...)
+    :param sender: int, sender id (0 means the server itself)
+    :param seq: int, sequence number of this frame (the simulcast layers of one captured frame share it)
+    :param timestamp: float, capture time in seconds, time.time() by default
+    :param flags: int, frame flags
+    :return: bytes, header + payload
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    header = FRAME_HEADER.pack(frame_type, flags, sender, seq & 0xFFFFFFFF, timestamp, len(payload))
+    return header + payload
+
+
+def write_frame(writer, frame_type, payload, sender=0, seq=0, timestamp=None, flags=0):
+    """
+    Write one media frame to a StreamWriter without concatenating header and payload.
+    The caller is responsible for awaiting writer.drain().
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    writer.write(FRAME_HEADER.pack(frame_type, flags, sender, seq & 0xFFFFFFFF, timestamp, len(payload)))
+    writer.write(payload)
+
+
+def frame_layer(flags):
+    """
+    :return: int, simulcast layer index carried in the frame flags
+    """
+    return (flags & FLAG_LAYER_MASK) >> LAYER_SHIFT
+
+
+def is_delta_frame(flags):
+    """
+    :return: bool, the frame only applies on top of earlier frames of its sender
+             (screen delta tiles, or an inter-frame camera packet that is not a keyframe)
+    """
+    return bool(flags & FLAG_DELTA or (flags & FLAG_CODEC_MASK and not flags & FLAG_KEYFRAME))
+
+
+def is_chain_frame(flags):
+    """
+    :return: bool, the frame belongs to a keyframe/delta chain, so losing it breaks the deltas that follow
+    """
+    return bool(flags & (FLAG_KEYFRAME | FLAG_DELTA | FLAG_CODEC_MASK))
+
+
+def layer_flags(layer):
+    """
+    :return: int, frame flags marking a simulcast layer (0-3)
+    """
+    return (layer << LAYER_SHIFT) & FLAG_LAYER_MASK
+
+
+async def read_frame(reader):
+    """
+    Read one media frame from a StreamReader.
+
+    :param reader: asyncio.StreamReader
+    :return: (FrameHeader, bytes) or None if the connection was closed or reset, or sent a corrupt header,
+             so callers run their normal disconnect cleanup
+    """
+    try:
+        header = FrameHeader(*FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size)))
+        if header.length > MAX_FRAME_SIZE:  # 长度字段损坏或恶意: 之后的数据无法再对齐, 按断开处理
+            print(f'[Warn] Frame too large: {header.length} bytes, closing the connection')
+            return None
+        payload = await reader.readexactly(header.length) if header.length else b''
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return header, payload
@@ -0,0 +1,175 @@
+# 摄像头/屏幕流的自适应码率控制: 根据 drain 延迟和发送缓冲区增长 (UDP 则根据服务器报告的丢包率) 调整质量、分辨率和帧率
+# 以及 simulcast 时服务器为每个接收者选择的摄像头层
+from collections import deque
+
+from config import (RATE_DRAIN_HIGH, RATE_DRAIN_LOW, RATE_BUFFER_HIGH, RATE_LOSS_HIGH, RATE_LOSS_LOW,
+                    RATE_HOLD_FRAMES, RATE_RECOVER_FRAMES, RATE_SCALES, SIMULCAST_LAYERS, CANVAS_SIZE,
+                    camera_width)
+
+
+class RateController:
+    def __init__(self, data_type, quality=60, min_quality=20, max_quality=85, fps=20, min_fps=5):
+        """
+        AIMD-style controller for one data connection. On congestion it steps down JPEG quality
+        first, then resolution, then frame rate; after a run of good frames it steps back up
+        in the reverse order.
+
+        :param data_type: 'video' or 'screen', used in reports
+        :param quality: initial and preferred JPEG quality
+        :param fps: initial and maximum frame rate
+        """
+        self.data_type = data_type
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.max_fps = fps
+        self.min_fps = min_fps
+        self.fps = fps
+        self.scale_index = 0
+        self.latency = 0.0  # EWMA of drain time
+        self.loss = 0.0  # UDP: last loss share reported by the server (drain() is a no-op there)
+        self.last_buffer = 0
+        self.hold = 0
+        self.good = 0
+        self.decisions = []  # (reason, settings) of every change
+
+    @property
+    def scale(self):
+        return RATE_SCALES[self.scale_index]
+
+    def on_sent(self, drain_time, buffer_size, loss=None):
+        """
+        Feed the measurements of one sent frame.
+
+        :param drain_time: seconds the writer's drain() took
+        :param buffer_size: bytes left in the transport's send buffer
+        :param loss: UDP only, share of frames lost in a new report of the server (DatagramWriter.pop_loss)
+        :return: str describing the change of settings, or None
+        """
+        self.latency = 0.8 * self.latency + 0.2 * drain_time
+        growing = buffer_size > self.last_buffer and buffer_size > RATE_BUFFER_HIGH
+        self.last_buffer = buffer_size
+        lossy = loss is not None and loss > RATE_LOSS_HIGH
+        if loss is not None:
+            self.loss = loss
+        if self.hold and not lossy:  # 每个丢包报告只出现一次, 不能被 hold 吞掉
+            self.hold -= 1
+            return None
+        if self.latency > RATE_DRAIN_HIGH or growing or lossy:
+            self.good = 0
+            self.hold = RATE_HOLD_FRAMES
+            return self.step_down(f'drain {self.latency * 1000:.0f}ms, buffer {buffer_size}B, loss {self.loss:.0%}')
+        if self.latency < RATE_DRAIN_LOW and buffer_size < RATE_BUFFER_HIGH and self.loss <= RATE_LOSS_LOW:
+            self.good += 1
+            if self.good >= RATE_RECOVER_FRAMES:
+                self.good = 0
+                return self.step_up()
+        else:
+            self.good = 0
+        return None
+
+    def step_down(self, reason):
+        if self.quality > self.min_quality:
+            self.quality = max(self.quality - 10, self.min_quality)
+        elif self.scale_index < len(RATE_SCALES) - 1:
+            self.scale_index += 1
+        elif self.fps > self.min_fps:
+            self.fps = max(self.fps // 2, self.min_fps)
+        else:
+            return None
+        return self.report(f'down ({reason})')
+
+    def step_up(self):
+        if self.fps < self.max_fps:
+            self.fps = min(self.fps * 2, self.max_fps)
+        elif self.scale_index > 0:
+            self.scale_index -= 1
+        elif self.quality < self.max_quality:
+            self.quality = min(self.quality + 5, self.max_quality)
+        else:
+            return None
+        return self.report('up')
+
+    def report(self, reason):
+        settings = self.get_stats()
+        self.decisions.append((reason, settings))
+        return f"[Rate] {self.data_type} {reason}: quality={self.quality} scale={self.scale} fps={self.fps}"
+
+    def get_stats(self):
+        return {'quality': self.quality, 'scale': self.scale, 'fps': self.fps,
+                'drain_ms': round(self.latency * 1000, 2), 'loss': round(self.loss, 3)}
+
+
+class LayerSelector:
+    def __init__(self, client_id, layers=SIMULCAST_LAYERS):
+        """
+        Simulcast layer the server forwards to one relay-mode video receiver.
+        The viewport sets the smallest layer still as wide as a camera tile is shown; frames dropped
+        from the receiver's send queue step down one more layer, and after a run of frames without
+        drops it steps back up, like RateController.
+
+        :param client_id: video client id of the receiver, used in reports
+        :param layers: (scale, quality) of each layer, largest first
+        """
+        self.client_id = client_id
+        self.layers = layers
+        self.viewport_layer = 0  # 按显示尺寸够用的最小层
+        self.congestion_layer = 0  # 拥塞时额外降低到的层
+        self.last_dropped = 0
+        self.hold = 0
+        self.good = 0
+        self.decisions = deque(maxlen=50)  # (reason, layer) of the latest changes
+        self.switches = {'down': 0, 'up': 0}
+
+    @property
+    def layer(self):
+        return max(self.viewport_layer, self.congestion_layer)
+
+    def set_viewport(self, viewport, canvas_size=CANVAS_SIZE):
+        """
+        :param viewport: (width, height) the receiver shows its composite at
+        :param canvas_size: (width, height) of the composite, camera tiles are 60% of camera_width on it
+        """
+        shown = min(viewport[0] / canvas_size[0], viewport[1] / canvas_size[1])
+        tile_width = camera_width * 0.6 * shown
+        self.viewport_layer = 0
+        for layer, (scale, _) in enumerate(self.layers):
+            if camera_width * scale >= tile_width:
+                self.viewport_layer = layer
+        self.decisions.append((f'viewport {viewport[0]}x{viewport[1]}', self.layer))
+
+    def on_frame(self, dropped):
+        """
+        Feed the receiver's drop counter each time it is sent a camera frame.
+
+        :param dropped: int, total frames dropped from its send queue
+        :return: 'down' or 'up' if the layer changed, else None; the change is kept in decisions
+        """
+        congested = dropped > self.last_dropped
+        self.last_dropped = dropped
+        if self.hold:
+            self.hold -= 1
+            return None
+        if congested:
+            self.good = 0
+            if self.layer == len(self.layers) - 1:
+                return None  # 已经是最小的层
+            self.congestion_layer = self.layer + 1
+            self.hold = RATE_HOLD_FRAMES
+            return self.report('down', 'send queue dropping')
+        self.good += 1
+        if self.good >= RATE_RECOVER_FRAMES and self.congestion_layer > self.viewport_layer:
+            self.good = 0
+            self.congestion_layer -= 1
+            return self.report('up')
+        return None
+
+    def report(self, direction, reason=None):
+        self.switches[direction] += 1
+        self.decisions.append((f'{direction} ({reason})' if reason else direction, self.layer))
+        return direction
+
+    def get_stats(self):
+        return {'layer': self.layer, 'viewport_layer': self.viewport_layer,
+                'congestion_layer': self.congestion_layer, 'dropped': self.last_dropped,
+                'switches': dict(self.switches)}
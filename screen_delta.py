@@ -0,0 +1,121 @@
+# 屏幕共享的分块增量编码: 只发送变化的图块, 并定期发送关键帧
+import struct
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from config import SCREEN_TILE_SIZE, SCREEN_KEYFRAME_INTERVAL, SCREEN_QUALITY
+from protocol import FLAG_KEYFRAME, FLAG_DELTA
+
+DELTA_HEADER = struct.Struct('!HHHH')  # width, height, tile size, number of tiles
+TILE_HEADER = struct.Struct('!HHI')  # column, row, JPEG length
+
+
+def encode_jpeg(image, quality):
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class ScreenDeltaEncoder:
+    def __init__(self, tile_size=SCREEN_TILE_SIZE, keyframe_interval=SCREEN_KEYFRAME_INTERVAL,
+                 quality=SCREEN_QUALITY, max_changed_ratio=0.5):
+        """
+        Split screen frames into tiles and encode only the tiles that differ from the previous frame.
+
+        :param tile_size: tile edge in pixels
+        :param keyframe_interval: frames between two full keyframes (also lets late joiners catch up)
+        :param quality: JPEG quality of keyframes and tiles
+        :param max_changed_ratio: above this share of changed tiles a keyframe is sent instead
+        """
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.quality = quality
+        self.max_changed_ratio = max_changed_ratio
+        self.previous = None  # np.ndarray of the last frame sent
+        self.frames_since_keyframe = 0
+        self.keyframe_requested = False
+
+    def encode(self, image, scale=1.0):
+        """
+        :param image: PIL.Image, captured screen
+        :param scale: float, resolution factor chosen by the rate controller
+        :return: (flags, payload bytes), or None if nothing changed
+        """
+        image = image.convert('RGB')
+        if scale != 1.0:  # 分辨率变化会触发关键帧
+            image = image.resize((max(int(image.width * scale), 1), max(int(image.height * scale), 1)), Image.BILINEAR)
+        frame = np.asarray(image)
+        self.frames_since_keyframe += 1
+        if self.previous is None or self.previous.shape != frame.shape or self.keyframe_requested \
+                or self.frames_since_keyframe >= self.keyframe_interval:
+            return self.keyframe(image, frame)
+
+        height, width = frame.shape[:2]
+        size = self.tile_size
+        rows, cols = -(-height // size), -(-width // size)
+        diff = np.any(frame != self.previous, axis=2)
+        padded = np.zeros((rows * size, cols * size), dtype=bool)
+        padded[:height, :width] = diff
+        changed = padded.reshape(rows, size, cols, size).any(axis=(1, 3))
+        count = int(changed.sum())
+        if count == 0:
+            return None
+        if count > changed.size * self.max_changed_ratio:
+            return self.keyframe(image, frame)
+
+        parts = [DELTA_HEADER.pack(width, height, size, count)]
+        for row, col in zip(*np.nonzero(changed)):
+            tile = image.crop((col * size, row * size, min((col + 1) * size, width), min((row + 1) * size, height)))
+            data = encode_jpeg(tile, self.quality)
+            parts.append(TILE_HEADER.pack(col, row, len(data)))
+            parts.append(data)
+        # 只更新发送过的图块, 使未发送的细微变化在下一帧继续累积比较
+        mask = np.repeat(np.repeat(changed, size, axis=0), size, axis=1)[:height, :width]
+        self.previous = self.previous.copy()
+        self.previous[mask] = frame[mask]
+        return FLAG_DELTA, b''.join(parts)
+
+    def force_keyframe(self):
+        """
+        Make the next encoded frame a keyframe, e.g. when the server lost a delta for some receiver.
+        """
+        self.keyframe_requested = True
+
+    def keyframe(self, image, frame):
+        self.previous = frame
+        self.frames_since_keyframe = 0
+        self.keyframe_requested = False
+        return FLAG_KEYFRAME, encode_jpeg(image, self.quality)
+
+
+class ScreenCanvas:
+    def __init__(self):
+        """
+        Receiver side of ScreenDeltaEncoder: keeps the current screen and patches it with delta tiles.
+        """
+        self.canvas = None
+
+    def apply(self, flags, payload):
+        """
+        :param flags: frame header flags
+        :param payload: bytes, keyframe JPEG or delta tiles
+        :return: PIL.Image, a copy of the updated screen, or None if no keyframe has arrived yet
+        """
+        if not flags & FLAG_DELTA:  # 关键帧(或不带标志的旧式整帧)
+            self.canvas = Image.open(BytesIO(payload)).convert('RGB')
+            return self.canvas.copy()
+        if self.canvas is None:
+            return None
+        width, height, size, count = DELTA_HEADER.unpack_from(payload, 0)
+        if self.canvas.size != (width, height):
+            return None  # 分辨率变了, 等下一个关键帧
+        offset = DELTA_HEADER.size
+        for _ in range(count):
+            col, row, length = TILE_HEADER.unpack_from(payload, offset)
+            offset += TILE_HEADER.size
+            tile = Image.open(BytesIO(payload[offset:offset + length]))
+            self.canvas.paste(tile, (col * size, row * size))
+            offset += length
+        return self.canvas.copy()
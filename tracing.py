@@ -0,0 +1,105 @@
+# 逐帧延迟追踪(可选): 摄像头帧在负载前携带各阶段的起止时间, 接收端汇总成分阶段的延迟统计
+import json
+import struct
+from collections import deque
+
+import numpy as np
+
+from config import TRACE_WINDOW
+
+# stages in pipeline order; uplink/downlink are opened by the sending side and closed by the receiving side
+TRACE_STAGES = ('capture', 'encode', 'uplink', 'server_decode', 'server_queue', 'compose', 'server_encode',
+                'downlink', 'decode', 'render')
+TRACE_COUNT = struct.Struct('!B')
+TRACE_SPAN = struct.Struct('!Bdd')  # stage index, start, end (time.time(), so clocks must be in sync across hosts)
+
+
+def pack_trace(spans, payload):
+    """
+    Prefix a payload with its trace spans; the frame must carry FLAG_TRACE.
+
+    :param spans: list of (stage name, start, end)
+    :return: bytes
+    """
+    parts = [TRACE_COUNT.pack(len(spans))]
+    parts += [TRACE_SPAN.pack(TRACE_STAGES.index(stage), start, end) for stage, start, end in spans]
+    parts.append(payload)
+    return b''.join(parts)
+
+
+def unpack_trace(payload):
+    """
+    :return: (list of (stage name, start, end), the payload without the trace prefix)
+    """
+    count = TRACE_COUNT.unpack_from(payload)[0]
+    offset = TRACE_COUNT.size
+    spans = []
+    for _ in range(count):
+        stage, start, end = TRACE_SPAN.unpack_from(payload, offset)
+        spans.append((TRACE_STAGES[stage], start, end))
+        offset += TRACE_SPAN.size
+    return spans, payload[offset:]
+
+
+def close_span(spans, end):
+    """
+    Set the end of the last (network) span, opened by the previous hop when it sent the frame.
+    """
+    if spans:
+        stage, start, _ = spans[-1]
+        spans[-1] = (stage, start, end)
+
+
+class FrameTracer:
+    def __init__(self, window=TRACE_WINDOW):
+        """
+        Rolling per-stage latency of the last traced frames.
+
+        :param window: number of frames kept per stage
+        """
+        self.durations = {stage: deque(maxlen=window) for stage in TRACE_STAGES}
+        self.totals = deque(maxlen=window)
+        self.events = deque(maxlen=window * len(TRACE_STAGES))  # Chrome trace 'X' events
+        self.frames = 0
+
+    def record(self, spans, sender=0, seq=0):
+        """
+        Add the spans of one displayed frame.
+        """
+        if not spans:
+            return
+        for stage, start, end in spans:
+            self.durations[stage].append(end - start)
+            self.events.append({'name': stage, 'cat': 'frame', 'ph': 'X', 'ts': start * 1e6,
+                                'dur': max(end - start, 0) * 1e6, 'pid': sender,
+                                'tid': TRACE_STAGES.index(stage), 'args': {'seq': seq}})
+        self.totals.append(spans[-1][2] - spans[0][1])
+        self.frames += 1
+
+    def get_breakdown(self):
+        """
+        :return: {stage: {'avg_ms', 'p95_ms', 'count'}} for every stage seen, plus 'total'
+        """
+        breakdown = {}
+        for stage, values in list(self.durations.items()) + [('total', self.totals)]:
+            if values:
+                values = np.array(values) * 1000
+                breakdown[stage] = {'avg_ms': round(float(values.mean()), 2),
+                                    'p95_ms': round(float(np.percentile(values, 95)), 2),
+                                    'count': len(values)}
+        return breakdown
+
+    def format_breakdown(self):
+        return ', '.join(f"{stage} {stats['avg_ms']:.1f}/{stats['p95_ms']:.1f}"
+                         for stage, stats in self.get_breakdown().items()) + ' ms (avg/p95)'
+
+    def dump_chrome_trace(self, path):
+        """
+        Write the recorded spans as Chrome trace JSON (chrome://tracing, Perfetto): one process per sender,
+        one row per stage.
+        """
+        names = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': stage}}
+                 for pid in {event['pid'] for event in self.events} for tid, stage in enumerate(TRACE_STAGES)]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': names + list(self.events), 'displayTimeUnit': 'ms'}, f)
+        return path
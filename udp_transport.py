@@ -0,0 +1,231 @@
+# UDP 媒体传输: 帧按 MTU 分片, 接收端重组, 丢失的帧直接丢弃而不是重传
+import asyncio
+import json
+import struct
+import time
+
+from config import DGRAM_SIZE, REASSEMBLY_TIMEOUT, UDP_KEEPALIVE_INTERVAL, UDP_PEER_TIMEOUT
+from protocol import FRAME_HEADER, FRAME_HELLO, pack_frame
+
+DATAGRAM_HEADER = struct.Struct('!IHH')  # frame id, fragment index, fragment count
+
+
+def fragment_frame(frame_id, frame, size=DGRAM_SIZE):
+    """
+    Split one packed frame into datagrams of at most size bytes.
+
+    :param frame_id: int, id shared by all fragments of the frame
+    :param frame: bytes, packed frame (header + payload)
+    :return: list of bytes
+    """
+    chunk = size - DATAGRAM_HEADER.size
+    count = max(-(-len(frame) // chunk), 1)
+    if count > 0xFFFF:
+        raise ValueError(f'Frame too large for datagram transport: {len(frame)} bytes')
+    return [DATAGRAM_HEADER.pack(frame_id, index, count) + frame[index * chunk:(index + 1) * chunk]
+            for index in range(count)]
+
+
+class FrameReassembler:
+    def __init__(self, timeout=REASSEMBLY_TIMEOUT):
+        """
+        Collect the fragments of one remote address back into frames.
+
+        :param timeout: seconds an incomplete frame is kept before it counts as lost
+        """
+        self.timeout = timeout
+        self.partial = {}  # frame id: [fragment count, {index: bytes}, first seen]
+        self.last_id = None  # newest frame id seen, a jump over several ids means whole frames were lost
+        self.completed = 0
+        self.lost = 0
+
+    def add(self, datagram):
+        """
+        :param datagram: bytes, one received datagram
+        :return: bytes of a complete packed frame, or None
+        """
+        if len(datagram) < DATAGRAM_HEADER.size:
+            return None
+        frame_id, index, count = DATAGRAM_HEADER.unpack_from(datagram)
+        chunk = datagram[DATAGRAM_HEADER.size:]
+        ahead = (frame_id - self.last_id) & 0xFFFFFFFF if self.last_id is not None else 1
+        if 0 < ahead < 0x80000000:  # 更新的帧 (乱序到达的旧帧不计入)
+            self.lost += ahead - 1
+            self.last_id = frame_id
+        if count == 1:
+            self.completed += 1
+            return chunk
+        now = time.monotonic()
+        for expired in [fid for fid, entry in self.partial.items() if now - entry[2] > self.timeout]:
+            del self.partial[expired]
+            self.lost += 1
+        entry = self.partial.setdefault(frame_id, [count, {}, now])
+        entry[1][index] = chunk
+        if len(entry[1]) < entry[0]:
+            return None
+        del self.partial[frame_id]
+        self.completed += 1
+        return b''.join(entry[1][i] for i in range(entry[0]))
+
+
+class DatagramWriter:
+    def __init__(self, transport, addr=None, on_close=None, owns_transport=False):
+        """
+        StreamWriter look-alike for a datagram peer: each complete packed frame written to it
+        (in one or several write() calls) is fragmented and sent to addr.
+
+        :param transport: asyncio.DatagramTransport
+        :param addr: remote address, None on a connected (client) transport
+        :param on_close: callable run by close()
+        :param owns_transport: close the transport too (client side)
+        """
+        self.transport = transport
+        self.addr = addr
+        self.on_close = on_close
+        self.owns_transport = owns_transport
+        self.pending = bytearray()
+        self.frame_id = 0
+        self.report = None  # (completed, lost) counters of our frames in the far end's newest report, not yet used
+        self.report_base = (0, 0)  # counters of the report pop_loss used last
+        self.closed = False
+
+    def write(self, data):
+        if self.closed:
+            return
+        self.pending += data
+        while len(self.pending) >= FRAME_HEADER.size:
+            length = FRAME_HEADER.size + FRAME_HEADER.unpack_from(self.pending)[-1]
+            if len(self.pending) < length:
+                break
+            frame = bytes(self.pending[:length])
+            del self.pending[:length]
+            for datagram in fragment_frame(self.frame_id, frame):
+                self.transport.sendto(datagram, self.addr)
+            self.frame_id = (self.frame_id + 1) & 0xFFFFFFFF
+
+    async def drain(self):
+        pass  # UDP 不做流控, 拥塞信号来自对端的丢包报告 (pop_loss)
+
+    def pop_loss(self):
+        """
+        Congestion signal of a datagram link, in place of the drain time a TCP writer gives.
+
+        :return: float, share of frames lost since the previous call, or None if no new report came in
+        """
+        if self.report is None:
+            return None
+        (completed, lost), (base_completed, base_lost) = self.report, self.report_base
+        self.report_base, self.report = self.report, None
+        frames = (completed - base_completed) + (lost - base_lost)
+        return (lost - base_lost) / frames if frames > 0 else None
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.on_close:
+            self.on_close()
+        if self.owns_transport:
+            self.transport.close()
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        if name == 'peername':
+            return self.addr or self.transport.get_extra_info('peername', default)
+        return self.transport.get_extra_info(name, default)
+
+
+class MediaDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_peer=None):
+        """
+        Datagram endpoint that turns each remote address into a (StreamReader, DatagramWriter) pair,
+        so the TCP frame handling (read_frame / write_frame) works unchanged on top of it.
+
+        Every UDP_KEEPALIVE_INTERVAL the client sends an empty FRAME_HELLO, and the server sends each peer
+        a FRAME_HELLO loss report (read by the client protocol into its writer's pop_loss) and closes
+        peers silent for UDP_PEER_TIMEOUT.
+
+        :param on_peer: server side, coroutine function called with (reader, writer) for every new
+                        remote address; None on the client side, where the only peer is the server
+        """
+        self.on_peer = on_peer
+        self.transport = None
+        self.peers = {}  # addr: [FrameReassembler, StreamReader, DatagramWriter, last datagram time]
+        self.reader = None  # client side
+        self.writer = None
+        self.timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.on_peer is None:
+            self.reader, self.writer = self.open_peer(None, owns_transport=True)
+        self.timer = asyncio.get_running_loop().call_later(UDP_KEEPALIVE_INTERVAL, self.keepalive)
+
+    def open_peer(self, addr, owns_transport=False):
+        reader = asyncio.StreamReader()
+        writer = DatagramWriter(self.transport, addr, lambda: self.close_peer(addr), owns_transport)
+        self.peers[addr] = [FrameReassembler(), reader, writer, time.monotonic()]
+        return reader, writer
+
+    def close_peer(self, addr):
+        peer = self.peers.pop(addr, None)
+        if peer:
+            peer[1].feed_eof()
+            peer[2].closed = True
+
+    def keepalive(self):
+        now = time.monotonic()
+        for addr, (reassembler, _, writer, last_seen) in list(self.peers.items()):
+            if self.on_peer is None:
+                writer.write(pack_frame(FRAME_HELLO, b''))
+            elif now - last_seen > UDP_PEER_TIMEOUT:
+                print(f"[Info] Datagram peer {addr[0]}:{addr[1]} timed out")
+                self.close_peer(addr)  # 处理函数读到 EOF, 按断开清理
+            else:
+                report = {'completed': reassembler.completed, 'lost': reassembler.lost}
+                writer.write(pack_frame(FRAME_HELLO, json.dumps({'report': report}).encode()))
+        self.timer = asyncio.get_running_loop().call_later(UDP_KEEPALIVE_INTERVAL, self.keepalive)
+
+    def on_report(self, payload):
+        """
+        Client side: keep the server's cumulative counters of our frames for the writer's pop_loss.
+        """
+        try:
+            report = json.loads(payload.decode())['report']
+            self.writer.report = (int(report['completed']), int(report['lost']))
+        except (ValueError, UnicodeDecodeError, KeyError, TypeError):
+            pass
+
+    def datagram_received(self, data, addr):
+        key = addr if self.on_peer else None
+        peer = self.peers.get(key)
+        if peer is None:
+            if self.on_peer is None:
+                return
+            reader, writer = self.open_peer(addr)
+            asyncio.ensure_future(self.on_peer(reader, writer))
+            peer = self.peers[addr]
+        peer[3] = time.monotonic()
+        frame = peer[0].add(data)
+        if not frame:
+            return
+        if self.on_peer is None and frame[0] == FRAME_HELLO:  # 服务器的丢包报告, 不交给应用层
+            self.on_report(frame[FRAME_HEADER.size:])
+            return
+        peer[1].feed_data(frame)
+
+    def error_received(self, exc):
+        print(f"[Warn] Datagram error: {exc}")
+
+    def connection_lost(self, exc):
+        if self.timer:
+            self.timer.cancel()
+        for addr in list(self.peers):
+            self.close_peer(addr)
+
+    def get_stats(self):
+        return {f"{addr[0]}:{addr[1]}" if addr else 'server': {'completed': peer[0].completed,
+                                                                'lost': peer[0].lost}
+                for addr, peer in self.peers.items()}
@@ -0,0 +1,185 @@
+# 摄像头的帧间压缩编码 (VP8/H.264, 通过 PyAV), 不可用时退回 JPEG
+from fractions import Fraction
+
+from config import VIDEO_KEYFRAME_INTERVAL, VIDEO_BITRATE
+from protocol import FLAG_KEYFRAME, FLAG_VP8, FLAG_H264
+
+_av = []  # [module or None] once load_av() ran
+
+
+def load_av():
+    """
+    Import PyAV on first use, so importing this module stays cheap for JPEG-only processes.
+
+    :return: the av module, or None if PyAV is not installed (optional dependency)
+    """
+    if not _av:
+        try:
+            import av
+        except ImportError:  # PyAV 是可选依赖
+            av = None
+        _av.append(av)
+    return _av[0]
+
+# codec name: (encoder, decoder, frame flag)
+VIDEO_CODECS = {
+    'vp8': ('libvpx', 'vp8', FLAG_VP8),
+    'h264': ('libx264', 'h264', FLAG_H264),
+}
+ENCODER_OPTIONS = {
+    'vp8': {'deadline': 'realtime', 'cpu-used': '8', 'lag-in-frames': '0'},
+    'h264': {'preset': 'ultrafast', 'tune': 'zerolatency'},
+}
+
+
+def available_video_codecs():
+    """
+    :return: list of camera codecs this process can both encode and decode, 'jpeg' always included
+    """
+    codecs = ['jpeg']
+    av = load_av()
+    if av is None:
+        return codecs
+    for name, (encoder, decoder, _) in VIDEO_CODECS.items():
+        try:
+            av.codec.Codec(encoder, 'w')
+            av.codec.Codec(decoder, 'r')
+            codecs.append(name)
+        except Exception:
+            pass
+    return codecs
+
+
+def negotiate_video_codec(requested, client_codecs):
+    """
+    Pick the camera codec of a conference or of a joining client.
+
+    :param requested: str, preferred codec
+    :param client_codecs: list of codecs the client supports
+    :return: str, requested if both sides support it, otherwise 'jpeg'
+    """
+    if requested in (client_codecs or []) and requested in available_video_codecs():
+        return requested
+    return 'jpeg'
+
+
+def video_codec_from_flags(flags):
+    for name, (_, _, flag) in VIDEO_CODECS.items():
+        if flags & flag:
+            return name
+    return 'jpeg'
+
+
+class VideoEncoder:
+    def __init__(self, codec='vp8', fps=20, keyframe_interval=VIDEO_KEYFRAME_INTERVAL, bitrate=VIDEO_BITRATE):
+        """
+        Inter-frame encoder for camera frames. The codec context is (re)opened on the first frame,
+        when the resolution changes and when the bitrate changes.
+
+        :param codec: 'vp8' or 'h264'
+        :param keyframe_interval: GOP size, frames between two keyframes
+        :param bitrate: bits per second at quality 100
+        """
+        self.codec = codec
+        self.fps = fps
+        self.keyframe_interval = keyframe_interval
+        self.max_bitrate = bitrate
+        self.bitrate = bitrate * 60 // 100
+        self.context = None
+        self.pts = 0
+        self.keyframe_requested = False
+
+    def force_keyframe(self):
+        """
+        Make the next encoded frame a keyframe, e.g. when the server lost a packet for some receiver.
+        """
+        self.keyframe_requested = True
+
+    def set_quality(self, quality):
+        """
+        Map a JPEG-style quality (0-100) from the rate controller to a target bitrate.
+        """
+        bitrate = self.max_bitrate * quality // 100
+        if bitrate != self.bitrate:
+            self.bitrate = bitrate
+            self.context = None  # 以新码率重新打开编码器 (从关键帧开始)
+
+    def open(self, width, height):
+        encoder, _, _ = VIDEO_CODECS[self.codec]
+        context = load_av().CodecContext.create(encoder, 'w')
+        context.width = width
+        context.height = height
+        context.pix_fmt = 'yuv420p'
+        context.time_base = Fraction(1, self.fps)
+        context.framerate = Fraction(self.fps, 1)
+        context.gop_size = self.keyframe_interval
+        context.bit_rate = self.bitrate
+        context.options = ENCODER_OPTIONS[self.codec]
+        context.open()
+        self.context = context
+
+    def encode(self, image, scale=1.0):
+        """
+        :param image: PIL.Image, captured camera frame
+        :param scale: float, resolution factor chosen by the rate controller
+        :return: (flags, payload bytes), or None if the encoder did not output a packet
+        """
+        width = max(int(image.width * scale), 2) // 2 * 2  # yuv420p 需要偶数宽高
+        height = max(int(image.height * scale), 2) // 2 * 2
+        if self.context is None or (self.context.width, self.context.height) != (width, height) \
+                or self.keyframe_requested:
+            self.keyframe_requested = False
+            self.open(width, height)  # 重新打开的编码器从关键帧开始
+        frame = load_av().VideoFrame.from_image(image.convert('RGB')).reformat(width=width, height=height, format='yuv420p')
+        frame.pts = self.pts
+        self.pts += 1
+        packets = self.context.encode(frame)
+        if not packets:
+            return None
+        flags = VIDEO_CODECS[self.codec][2]
+        if any(packet.is_keyframe for packet in packets):
+            flags |= FLAG_KEYFRAME
+        return flags, b''.join(bytes(packet) for packet in packets)
+
+
+class VideoDecoder:
+    def __init__(self, codec):
+        """
+        Decoder for one sender's inter-frame camera stream.
+
+        :param codec: 'vp8' or 'h264'
+        """
+        self.codec = codec
+        self.context = None
+        av = load_av()
+        if av is not None and codec in VIDEO_CODECS:
+            self.context = av.CodecContext.create(VIDEO_CODECS[codec][1], 'r')
+        self.waiting_keyframe = True
+        self.last_seq = None
+        self.gaps = 0  # seq gaps seen, each one a lost packet the following deltas depended on
+
+    def decode(self, payload, flags, seq=None):
+        """
+        :param payload: bytes, one encoded frame
+        :param flags: frame header flags
+        :param seq: frame header seq; a gap since the previous frame means a packet was lost,
+                    so the decoder waits for the next keyframe (callers then ask the sender for one)
+        :return: PIL.Image, or None (no decoder, waiting for a keyframe, or a corrupt packet)
+        """
+        if self.context is None:
+            return None
+        if seq is not None:
+            if self.last_seq is not None and seq != (self.last_seq + 1) & 0xFFFFFFFF:
+                self.gaps += 1
+                self.waiting_keyframe = True  # 参考帧丢失, 之后的差分帧会解出花屏
+            self.last_seq = seq
+        if self.waiting_keyframe:
+            if not flags & FLAG_KEYFRAME:
+                return None  # 中途加入: 等待下一个关键帧
+            self.waiting_keyframe = False
+        try:
+            frames = self.context.decode(load_av().Packet(payload))
+        except Exception:
+            self.waiting_keyframe = True
+            return None
+        return frames[-1].to_image() if frames else None